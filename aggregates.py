@@ -0,0 +1,57 @@
+import numpy as np
+
+#Continent x year summary tables of the indicators, computed from the cube the
+#first time an indicator is asked for and kept in the cube's cache.
+#
+#`table(stat, cont, name)` returns the per-year series of a statistic for one
+#continent, so the trend graphs never group the long table at request time.
+
+STATS = [
+    ('mean', 'Mean'),
+    ('weighted', 'Population-weighted mean'),
+    ('median', 'Median'),
+    ('min', 'Min'),
+    ('max', 'Max'),
+    ('count', 'Countries with data'),
+]
+STAT_LABELS = dict(STATS)
+
+
+class AggregateTables:
+    def __init__(self, cube, weight = 'Population'):
+        self.cube = cube
+        self.weight = weight
+        self.stat_code = {s: i for i, (s, _) in enumerate(STATS)}
+
+    def compute(self, name):
+        #stat x continent x year of one indicator
+        cube = self.cube
+        values = np.full((len(STATS), len(cube.continents), len(cube.years)), np.nan)
+        pop = cube.indicator(self.weight)
+        column = cube.indicator(name)
+        for c, cont in enumerate(cube.continents):
+            rows = cube.continent_rows[cont]
+            block = column[rows]
+            valid = ~np.isnan(block)
+            count = valid.sum(axis = 0)
+            has = count > 0
+
+            w = np.where(valid, pop[rows], 0.0)
+            w = np.where(np.isnan(w), 0.0, w)
+            wsum = w.sum(axis = 0)
+            filled = np.where(valid, block, 0.0)
+
+            out = values[:, c]
+            out[self.stat_code['mean']] = np.where(has, filled.sum(axis = 0) / np.maximum(count, 1), np.nan)
+            out[self.stat_code['weighted']] = np.where(wsum > 0, (filled * w).sum(axis = 0) / np.where(wsum > 0, wsum, 1), np.nan)
+            #only the years with data, an all-NaN year would warn and stays NaN
+            present = block[:, has]
+            out[self.stat_code['median'], has] = np.nanmedian(present, axis = 0)
+            out[self.stat_code['min'], has] = np.nanmin(present, axis = 0)
+            out[self.stat_code['max'], has] = np.nanmax(present, axis = 0)
+            out[self.stat_code['count']] = count
+        return values
+
+    def table(self, stat, cont, name):
+        values = self.cube.cache.fetch(('aggregates', name), lambda: self.compute(name))
+        return values[self.stat_code[stat], self.cube.continent_code[cont]]
@@ -0,0 +1,161 @@
+// Clientside callbacks for the gapminder dashboard.
+//
+// overviewFigure builds the overview bubble chart in the browser from the
+// compact per-year data sent once per axis pair (see render_overview_frames in
+// index.py) and plotly's template, which comes once with the app layout.
+// Changing the year dropdown, dragging the year slider or pressing play only
+// touches this function and plotly's animation, never the server.
+//
+// overviewSelection and contSelection reduce the box/lasso selections of the
+// overview and continent graphs to the selected country codes (the points'
+// customdata), the server intersects them as bitsets (see availability.py).
+//
+// compareView reduces the relayout events of the country comparison graph to
+// its zoomed x range and width, the server sends the series at that
+// resolution (see downsample.py).
+
+// a selection reducer per graph, a new figure clears the selection it drew
+function selection() {
+    var shown;
+    return function(selected, figure, current) {
+        var codes = null;
+        if (figure !== shown) {
+            shown = figure;
+        } else if (selected && selected.points) {
+            var seen = {};
+            selected.points.forEach(function(p) {
+                if (typeof p.customdata === 'number') {
+                    seen[p.customdata] = true;
+                }
+            });
+            codes = Object.keys(seen).map(Number).sort(function(a, b) { return a - b; });
+            codes = codes.length ? codes : null;
+        }
+        if (JSON.stringify(codes) === JSON.stringify(current === undefined ? null : current)) {
+            return window.dash_clientside.no_update;
+        }
+        return codes;
+    };
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    gapminder: {
+        overviewSelection: selection(),
+
+        contSelection: selection(),
+
+        overviewFigure: function(frames, year, template) {
+            if (!frames) {
+                return {data: [], layout: {}};
+            }
+            // no year has both axes, the server sent the empty-state figure
+            if (frames.empty) {
+                return frames.empty;
+            }
+
+            // same text as Python's str(): floats keep a trailing '.0', missing values are 'nan'
+            function text(v, isInt) {
+                if (v === null || v === undefined) {
+                    return 'nan';
+                }
+                if (!isInt && Number.isInteger(v) && Math.abs(v) < 1e16) {
+                    return v + '.0';
+                }
+                return String(v);
+            }
+
+            function traces(y) {
+                var yearValue = frames.years[y];
+                return frames.traces.map(function(t) {
+                    var x = t.x[y], yv = t.y[y];
+                    var hover = t.country.map(function(c, i) {
+                        return 'Country: ' + c + '<br>' +
+                            frames.xaxis + ': ' + text(x[i], frames.x_int) + ' <br>' +
+                            frames.yaxis + ': ' + text(yv[i], frames.y_int) + ' <br>' +
+                            'Year: ' + yearValue;
+                    });
+                    return {
+                        type: 'scatter',
+                        x: x,
+                        y: yv,
+                        customdata: t.codes,
+                        mode: 'markers',
+                        marker: {
+                            symbol: 0,
+                            color: t.color,
+                            // marker areas already divided by the year's sizeref
+                            size: t.size[y],
+                            sizemode: 'area',
+                            sizeref: 1,
+                            sizemin: 5,
+                            opacity: 0.7
+                        },
+                        name: t.name,
+                        hovertext: hover
+                    };
+                });
+            }
+
+            var active = Math.max(0, frames.years.indexOf(year));
+            var animation = {mode: 'immediate', frame: {duration: 150, redraw: false}, transition: {duration: 100}};
+            var still = {mode: 'immediate', frame: {duration: 0, redraw: false}, transition: {duration: 0}};
+
+            return {
+                data: traces(active),
+                frames: frames.years.map(function(yearValue, y) {
+                    return {name: String(yearValue), data: traces(y)};
+                }),
+                layout: {
+                    template: template,
+                    xaxis: {title: {text: frames.xaxis}, showgrid: true, gridcolor: 'lightgray'},
+                    yaxis: {title: {text: frames.yaxis}, showgrid: true, gridcolor: 'lightgray'},
+                    paper_bgcolor: 'white',
+                    plot_bgcolor: 'white',
+                    height: 520,
+                    margin: {t: 30},
+                    updatemenus: [{
+                        type: 'buttons',
+                        showactive: false,
+                        x: 0, y: -0.25, xanchor: 'left', yanchor: 'top',
+                        direction: 'left',
+                        buttons: [
+                            {label: 'Play', method: 'animate', args: [null, Object.assign({fromcurrent: true}, animation)]},
+                            {label: 'Pause', method: 'animate', args: [[null], still]}
+                        ]
+                    }],
+                    sliders: [{
+                        active: active,
+                        x: 0.12, len: 0.88, y: -0.15, yanchor: 'top',
+                        // 219 tick labels do not fit, the current year is shown above the slider instead
+                        font: {color: 'rgba(0,0,0,0)'},
+                        currentvalue: {prefix: 'Year: ', font: {color: '#444'}},
+                        steps: frames.years.map(function(yearValue) {
+                            return {label: String(yearValue), method: 'animate', args: [[String(yearValue)], still]};
+                        })
+                    }]
+                }
+            };
+        },
+
+        compareView: function(relayout, current) {
+            var view = Object.assign({range: null, width: null}, current);
+            var graph = document.getElementById('country_compare_cat');
+            // widths in steps of 100px, resizing does not refetch on every pixel
+            var width = graph && graph.offsetWidth ? Math.round(graph.offsetWidth / 100) * 100 : view.width;
+            var range = view.range;
+            if (relayout) {
+                if ('xaxis.range[0]' in relayout) {
+                    range = [relayout['xaxis.range[0]'], relayout['xaxis.range[1]']];
+                } else if (relayout['xaxis.range']) {
+                    range = relayout['xaxis.range'];
+                } else if (relayout['xaxis.autorange']) {
+                    range = null;
+                }
+            }
+            if (width === view.width && JSON.stringify(range) === JSON.stringify(view.range)) {
+                return window.dash_clientside.no_update;
+            }
+            return {range: range, width: width};
+        }
+    }
+});
@@ -0,0 +1,71 @@
+import numpy as np
+
+#Which countries have a value of an indicator in a year.
+#
+#Every indicator gets a bitmap of years x countries, one bit per country
+#(np.packbits, 25 bytes a year for 195 countries). It is built from the cube
+#the first time the indicator is asked for and kept in the cube's cache
+#(indicators.py). Sets of countries (a continent, the selected countries) are
+#bitsets of the same layout, so asking whether a view has data is an AND of a
+#few byte rows and never reads the indicator values. Callbacks use it to
+#answer with an empty-state figure, and the year controls only offer the
+#years that have data for the chosen indicators. Box/lasso selections of the
+#graphs are bitsets too and are intersected with the continent, the countries
+#with a record in the year (`records`) or with data, instead of filtering
+#frames with isin.
+
+
+class Availability:
+    def __init__(self, cube):
+        self.cube = cube
+        self.size = len(cube.countries)
+        self.everyone = self.bitset(np.arange(self.size))
+        self.continents = {cont: self.bitset(np.arange(self.size)[rows]) for cont, rows in cube.continent_rows.items()}
+        #years x packed countries with a row in the long table
+        self.records = np.packbits(np.asarray(cube.present).T, axis = 1)
+
+    def bitset(self, codes):
+        #packed set of country codes
+        member = np.zeros(self.size, dtype = bool)
+        member[np.asarray(codes, dtype = int)] = True
+        return np.packbits(member)
+
+    def codes(self, bits):
+        #country codes of a packed set, ascending
+        return np.flatnonzero(np.unpackbits(bits, count = self.size))
+
+    def selection(self, codes):
+        #packed set of the country codes a graph selection sent, None without a selection
+        if not codes:
+            return None
+        codes = np.asarray(codes, dtype = int)
+        return self.bitset(codes[(codes >= 0) & (codes < self.size)])
+
+    def bitmap(self, name):
+        #years x packed countries with a value of `name`
+        build = lambda: np.packbits(~np.isnan(self.cube.indicator(name).T), axis = 1)
+        return self.cube.cache.fetch(('available', name), build)
+
+    def countries(self, names, y = slice(None), within = None):
+        #packed countries of `within` (default all) with a value of every indicator of `names`, per year index of y
+        bits = self.everyone if within is None else within
+        for name in names:
+            bits = bits & self.bitmap(name)[y]
+        return bits
+
+    def with_data(self, name, within = None):
+        #packed countries of `within` with a value of `name` in some year
+        bits = np.bitwise_or.reduce(self.bitmap(name), axis = 0)
+        return bits if within is None else bits & within
+
+    def year_mask(self, names, within = None):
+        #years x bool: some country of `within` has every indicator
+        return self.countries(names, slice(None), within).any(axis = -1)
+
+    def years(self, names, within = None):
+        return self.cube.years[self.year_mask(names, within)].astype(int)
+
+    def has_data(self, names, year1, year2 = None, within = None):
+        #some country of `within` has every indicator in a year of the inclusive range
+        y = slice(self.cube.year_index(year1), self.cube.year_index(year1 if year2 is None else year2) + 1)
+        return bool(self.countries(names, y, within).any())
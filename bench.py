@@ -0,0 +1,208 @@
+import argparse
+import atexit
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+#figures would otherwise be served from (and cleared in) the shared cache directory
+os.environ.setdefault('GAPMINDER_CACHE_DISK_BYTES', '0')
+#the dispatches are counted apart from the app's /metrics
+os.environ['GAPMINDER_METRICS_DIR'] = tempfile.mkdtemp(prefix = 'gapminder-bench-metrics-')
+atexit.register(shutil.rmtree, os.environ['GAPMINDER_METRICS_DIR'], True)
+
+import encoding
+import figures
+import index
+
+#Callback latency benchmarks.
+#
+#Imports index.py without starting the server and times
+#   * every figure/table builder called directly (figure cache bypassed), and
+#   * every registered server callback through Dash's /_dash-update-component
+#     dispatch, so routing and JSON serialization are included,
+#over representative and worst-case inputs (all countries, 1800-2018, ...).
+#Each case reports p50/p95/p99 latency, peak traced memory and payload size (as
+#sent, ie. compressed when --accept-encoding allows it);
+#`--output` writes the results as JSON and `--compare` diffs two runs.
+#
+#   python bench.py --output before.json
+#   python bench.py --output after.json --compare before.json
+
+cube = index.datasets.current.cube
+ALL_COUNTRIES = sorted(cube.countries)
+DEFAULT_COUNTRIES = ['Vietnam','Gabon','Tuvalu','Slovenia','Jamaica','Chile']
+FIRST, LAST = int(cube.years[0]), int(cube.years[-1])
+PAGE = dict(page_current = 0, page_size = 20, sort_by = [], filter_query = '')
+SORTED = dict(PAGE, sort_by = [{'column_id': 'Life Expectancy', 'direction': 'desc'}],
+                filter_query = '{Life Expectancy} > 50')
+
+
+def builder_cases():
+    cases = {name: list(args) for name, args in figures.SAMPLES.items()}
+    cases['render_overview_frames'] = [('Life Expectancy', 'Income (per person)'),
+                                        ('Number of HIV cases', 'Human Development Index')]
+    cases['render_country_compare_cat'] += [(ALL_COUNTRIES, 'Income (per person)', None)]
+    cases['render_large_graph'] += [([FIRST, LAST], ALL_COUNTRIES, 'Income (per person)')]
+    cases['render_data_overview_table'] = [
+        (2005, 'Life Expectancy', 'Income (per person)') + tuple(PAGE.values()) + (None,),
+        (2005, 'Life Expectancy', 'Income (per person)') + tuple(SORTED.values()) + (None,),
+        (2005, 'Life Expectancy', 'Income (per person)') + tuple(SORTED.values()) + (list(range(0, 195, 3)),)]
+    cases['render_cont_table_data'] = [
+        ('Life Expectancy', 'Income (per person)', 'Africa', 2005) + tuple(PAGE.values()),
+        ('Life Expectancy', 'Income (per person)', 'Africa', 2005) + tuple(SORTED.values())]
+    cases['rendering_country_table_data'] = [
+        (DEFAULT_COUNTRIES, 'Income (per person)') + tuple(PAGE.values()),
+        (ALL_COUNTRIES, 'Life Expectancy') + tuple(SORTED.values())]
+    return cases
+
+
+#input values of every page control, keyed 'component.property'
+DEFAULTS = {
+    'overview_xaxis.value': 'Life Expectancy', 'overview_yaxis.value': 'Income (per person)',
+    'overview_year.value': 2005, 'overview_agg.value': 'mean',
+    'cont_xaxis.value': 'Life Expectancy', 'cont_yaxis.value': 'Income (per person)',
+    'cont.value': 'Asia', 'cont_year.value': 2005,
+    'country.value': DEFAULT_COUNTRIES, 'country_cat.value': 'Income (per person)',
+    'country_year.value': [1995, 2005],
+    'overview_selection.data': None, 'cont_selection.data': None,
+    'url.pathname': '/',
+}
+for table in ('table_1', 'table_2', 'table_3'):
+    for prop, value in PAGE.items():
+        DEFAULTS['{}.{}'.format(table, prop)] = value
+
+
+def dispatch_cases():
+    #(label, values override, changed props) for every server callback
+    scenarios = [
+        ('initial', {}, None),
+        ('worst: all countries, full range', {'country.value': ALL_COUNTRIES, 'country_year.value': [FIRST, LAST]}, None),
+        ('axis change', {'overview_xaxis.value': 'Population', 'cont_xaxis.value': 'Population'},
+            ['overview_xaxis.value', 'cont_xaxis.value']),
+        ('year change', {'overview_year.value': 1950, 'cont_year.value': 1950},
+            ['overview_year.value', 'cont_year.value']),
+        ('table page', {'table_1.page_current': 3, 'table_2.page_current': 1, 'table_3.page_current': 5},
+            ['table_1.page_current', 'table_2.page_current', 'table_3.page_current']),
+        ('graph selection', {'overview_selection.data': list(range(0, 195, 3)), 'cont_selection.data': list(range(0, 195, 3))},
+            ['overview_selection.data', 'cont_selection.data']),
+    ]
+    cases = {}
+    for output, spec in index.app.callback_map.items():
+        if 'callback' not in spec:
+            continue
+        inputs = ['{}.{}'.format(i['id'], i['property']) for i in spec['inputs']]
+        for label, override, changed in scenarios:
+            if override and not any(k in inputs for k in override):
+                continue
+            values = dict(DEFAULTS, **override)
+            fired = inputs if changed is None else [c for c in changed if c in inputs]
+            cases.setdefault(output, []).append((label, request_body(output, spec, values, fired)))
+    return cases
+
+
+def request_body(output, spec, values, changed):
+    outputs = [o.rsplit('.', 1) for o in output.strip('.').split('...')]
+    return {
+        'output': output,
+        'outputs': [{'id': i, 'property': p} for i, p in outputs] if len(outputs) > 1
+                    else {'id': outputs[0][0], 'property': outputs[0][1]},
+        'inputs': [dict(i, value = values.get('{}.{}'.format(i['id'], i['property'])))
+                    for i in spec['inputs']],
+        'state': [dict(s, value = values.get('{}.{}'.format(s['id'], s['property'])))
+                    for s in spec.get('state', [])],
+        'changedPropIds': changed,
+    }
+
+
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        payload = fn()
+        times.append(time.perf_counter() - t0)
+    #tracing slows allocations down a lot, so peak memory gets its own run
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return times, peak, payload
+
+
+def summarize(times, peak, payload):
+    ms = np.asarray(times) * 1000
+    return {
+        'n': len(ms),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'peak_kb': peak / 1024,
+        'payload_bytes': payload,
+    }
+
+
+def run(repeat, only = None, accept_encoding = None):
+    results = {}
+    for name, cases in builder_cases().items():
+        func = getattr(index, name)
+        func = getattr(func, '__wrapped__', func)
+        for i, args in enumerate(cases):
+            key = 'builder {} #{}'.format(name, i)
+            if only and only not in key:
+                continue
+            serialize = lambda: len(encoding.dumps(func(*args)))
+            results[key] = summarize(*measure(serialize, repeat))
+
+    index.figure_cache.clear()
+    client = index.app.server.test_client()
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    for output, cases in dispatch_cases().items():
+        for label, body in cases:
+            outputs = output.strip('.').split('...')
+            name = outputs[0] if len(outputs) == 1 else '{} (+{} outputs)'.format(outputs[0], len(outputs) - 1)
+            key = 'dispatch {} [{}]'.format(name, label)
+            if only and only not in key:
+                continue
+            def post():
+                index.figure_cache.clear()
+                response = client.post('/_dash-update-component', json = body, headers = headers)
+                if response.status_code not in (200, 204):
+                    raise RuntimeError('{} returned {}'.format(key, response.status_code))
+                return len(response.data)
+            results[key] = summarize(*measure(post, repeat))
+    return results
+
+
+def report(results, baseline = None):
+    print('{:<72} {:>9} {:>9} {:>9} {:>10} {:>10}'.format('case', 'p50 ms', 'p95 ms', 'p99 ms', 'peak KB', 'bytes'))
+    for key, r in results.items():
+        line = '{:<72} {:>9.2f} {:>9.2f} {:>9.2f} {:>10.0f} {:>10}'.format(
+            key[:72], r['p50_ms'], r['p95_ms'], r['p99_ms'], r['peak_kb'], r['payload_bytes'])
+        if baseline and key in baseline and baseline[key]['p50_ms']:
+            line += '  p50 {:+.0%}'.format(r['p50_ms'] / baseline[key]['p50_ms'] - 1)
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark every callback of the dashboard.')
+    parser.add_argument('--repeat', type = int, default = 20)
+    parser.add_argument('--only', help = 'run the cases whose name contains this text')
+    parser.add_argument('--output', help = 'write the results as JSON')
+    parser.add_argument('--compare', help = 'JSON results of an earlier run')
+    parser.add_argument('--accept-encoding', help = "Accept-Encoding of the dispatched requests, eg. 'br, gzip'")
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.only, args.accept_encoding)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    report(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'repeat': args.repeat,
+                        'results': results}, f, indent = 1)
@@ -0,0 +1,224 @@
+import json
+import os
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+import schema
+
+#Dense country x year x indicator cube over the long gapminder table.
+#
+#Countries are grouped by continent (continents in order of first appearance,
+#countries in file order inside each continent) so that every continent is a
+#contiguous row range. Year, continent and year-range lookups are then plain
+#slices of the countries x years arrays and never scan the table. Indicators
+#are held in their narrow schema encoding (schema.py) and decoded to float64
+#per slice. A loaded cube maps every indicator file read-only up front, which
+#reads no data, and keeps the tables derived from them in `cache` (see
+#indicators.py for the budgeted one of the app). An open map keeps its file
+#readable after datastore.load_cube removed the directory of an older version,
+#so requests still pinned to this cube finish on it.
+
+ID_COLUMNS = ['Country', 'Year', 'Continent']
+#arrays written by `save`, everything else goes to meta.json
+ARRAYS = ['country_continent', 'years', 'present', 'file_order']
+FORMAT_VERSION = 2
+
+
+class Memo(dict):
+    #unbounded cache, the default of a cube
+    def fetch(self, key, build):
+        if key not in self:
+            self[key] = build()
+        return self[key]
+
+
+class Columns(Mapping):
+    #indicator -> codes, a source is the codes or a function mapping them on first use
+    def __init__(self, cube, sources):
+        self.cube = cube
+        self.sources = dict(sources)
+
+    def __getitem__(self, name):
+        source = self.sources[name]
+        if callable(source):
+            #kept like the cube's own maps, a pinned version never loads it again
+            source = self.sources[name] = source()
+        return source
+
+    def __iter__(self):
+        return iter(self.sources)
+
+    def __len__(self):
+        return len(self.sources)
+
+
+class DataCube:
+    def __init__(self, countries, continents, country_continent, years, indicators, columns, encodings, present, dtypes, file_order = None):
+        self.countries = list(countries)
+        self.continents = list(continents)
+        self.country_continent = np.asarray(country_continent)
+        self.years = np.asarray(years)
+        self.indicators = list(indicators)
+        #(kind, indicator) -> array, eg. the loaded columns
+        self.cache = Memo()
+        #indicator -> countries x years codes, decoded with schema.decode(codes, encodings[indicator])
+        self.columns = Columns(self, columns)
+        self.encodings = dict(encodings)
+        self.present = present
+        self.dtypes = dict(dtypes)
+        #codes of the countries in file order, the row order of the original table
+        self.file_order = np.arange(len(self.countries)) if file_order is None else np.asarray(file_order)
+
+        self.country_code = {c: i for i, c in enumerate(self.countries)}
+        self.continent_code = {c: i for i, c in enumerate(self.continents)}
+        self.indicator_code = {c: i for i, c in enumerate(self.indicators)}
+        self.first_year = int(self.years[0])
+
+        #continent -> slice of country codes
+        bounds = np.searchsorted(self.country_continent, np.arange(len(self.continents) + 1))
+        self.continent_rows = {c: slice(int(bounds[i]), int(bounds[i + 1])) for i, c in enumerate(self.continents)}
+
+    @classmethod
+    def from_frame(cls, df):
+        indicators = [c for c in df.columns if c not in ID_COLUMNS]
+        continents = list(pd.unique(df['Continent']))
+        file_countries = list(pd.unique(df['Country']))
+        country_cont = df.drop_duplicates('Country').set_index('Country')['Continent']
+
+        #stable sort of the file order by continent
+        cont_of = np.array([continents.index(country_cont[c]) for c in file_countries], dtype = schema.CATEGORY_TYPE)
+        order = np.argsort(cont_of, kind = 'stable')
+        countries = [file_countries[i] for i in order]
+
+        years = np.arange(df['Year'].min(), df['Year'].max() + 1).astype(schema.YEAR_TYPE)
+        codes = {c: i for i, c in enumerate(countries)}
+        row = df['Country'].map(codes).values
+        col = df['Year'].values - int(years[0])
+
+        columns, encodings = {}, {}
+        for name in indicators:
+            dense = np.full((len(countries), len(years)), np.nan)
+            dense[row, col] = df[name].values.astype(float)
+            encodings[name] = schema.infer(dense)
+            columns[name] = schema.encode(dense, encodings[name])
+        present = np.zeros((len(countries), len(years)), dtype = bool)
+        present[row, col] = True
+
+        return cls(countries, continents, cont_of[order], years, indicators, columns, encodings, present,
+                    {c: df[c].dtype for c in indicators}, np.array([codes[c] for c in file_countries], dtype = schema.CATEGORY_TYPE))
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok = True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, name + '.npy'), np.ascontiguousarray(getattr(self, name)))
+        for i, name in enumerate(self.indicators):
+            np.save(os.path.join(directory, 'indicator{:02d}.npy'.format(i)), np.ascontiguousarray(self.columns[name]))
+        meta = {
+            'countries': self.countries,
+            'continents': self.continents,
+            'indicators': self.indicators,
+            'encodings': self.encodings,
+            'dtypes': {name: dtype.str for name, dtype in self.dtypes.items()},
+        }
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, directory):
+        #read-only memory maps: processes loading the same directory share its pages
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode = 'r') for name in ARRAYS}
+        columns = {name: np.load(os.path.join(directory, 'indicator{:02d}.npy'.format(i)), mmap_mode = 'r')
+                    for i, name in enumerate(meta['indicators'])}
+        return cls(meta['countries'], meta['continents'], arrays['country_continent'], arrays['years'],
+                    meta['indicators'], columns, meta['encodings'], arrays['present'],
+                    {name: np.dtype(dtype) for name, dtype in meta['dtypes'].items()}, arrays['file_order'])
+
+    def add_indicator(self, name, load):
+        #`load()` returns the codes and sets encodings[name] and dtypes[name]
+        self.indicator_code[name] = len(self.indicators)
+        self.indicators.append(name)
+        self.columns.sources[name] = load
+
+    def year_index(self, year):
+        y = int(year) - self.first_year
+        if not 0 <= y < len(self.years):
+            raise KeyError(year)
+        return y
+
+    def indicator(self, name, rows = slice(None), y = slice(None)):
+        #decoded float64 values of one indicator, NaN where missing
+        codes = self.columns[name]
+        return schema.decode(codes[rows, y], self.encodings[name])
+
+    def block(self, rows = slice(None), y = slice(None)):
+        #decoded countries x years x indicators
+        return np.stack([self.indicator(name, rows, y) for name in self.indicators], axis = -1)
+
+    def year_slice(self, year):
+        #countries x indicators for one year
+        return self.block(slice(None), self.year_index(year))
+
+    def continent_slice(self, cont, year):
+        return self.block(self.continent_rows[cont], self.year_index(year))
+
+    def year_range(self, year1, year2):
+        #countries x years x indicators for the inclusive range
+        return self.block(slice(None), slice(self.year_index(year1), self.year_index(year2) + 1))
+
+    def column(self, name, year, rows = slice(None)):
+        return self.indicator(name, rows, self.year_index(year))
+
+    def series(self, country, name):
+        #all years of one indicator for one country
+        return self.indicator(name, self.country_code[country])
+
+    def codes(self, countries):
+        return np.array([self.country_code[c] for c in countries], dtype = int)
+
+    def display(self, name, values):
+        #cast back to the source dtype (eg. Population is an integer column)
+        dtype = self.dtypes.get(name)
+        if dtype is not None and dtype.kind in 'iu':
+            return values.astype(dtype)
+        return values
+
+    def column_values(self, name, rows, y):
+        #display values of any column for (country code, year index) pairs
+        if name == 'Country':
+            return np.asarray(self.countries, dtype = object)[rows]
+        if name == 'Continent':
+            return np.asarray(self.continents, dtype = object)[self.country_continent[rows]]
+        if name == 'Year':
+            return self.years[y].astype(int)
+        return self.display(name, self.indicator(name, rows, y))
+
+    def rows_in_year(self, rows, year):
+        #country codes of `rows` that have a record for the year, order kept
+        rows = np.arange(len(self.countries))[rows]
+        return rows[self.present[rows, self.year_index(year)]]
+
+    def pairs(self, rows, year1 = None, year2 = None):
+        #every (country, year) pair of `rows` for the year range, country major
+        y0 = 0 if year1 is None else self.year_index(year1)
+        y1 = len(self.years) if year2 is None else self.year_index(year2) + 1
+        rows = np.asarray(rows, dtype = int)
+        y = np.tile(np.arange(y0, y1), len(rows))
+        rows = np.repeat(rows, y1 - y0)
+        keep = self.present[rows, y]
+        return rows[keep], y[keep]
+
+    def frame_pairs(self, rows, y, columns):
+        columns = list(dict.fromkeys(columns))
+        return pd.DataFrame({c: self.column_values(c, rows, y) for c in columns}, columns = columns)
+
+    def frame(self, rows, year, columns):
+        #rows of a single year as a small dataframe, in the order of `rows`
+        rows = self.rows_in_year(rows, year)
+        return self.frame_pairs(rows, np.full(len(rows), self.year_index(year)), columns)
+
+    def frame_long(self, rows, columns, year1 = None, year2 = None):
+        return self.frame_pairs(*self.pairs(rows, year1, year2), columns)
@@ -0,0 +1,149 @@
+import fcntl
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import flask
+
+import datastore
+import etl
+import indicators
+from aggregates import AggregateTables
+from availability import Availability
+from rangestats import RangeStats
+from search import NameIndex
+from tables import TableIndex
+
+#Versioned dataset handle with hot reload.
+#
+#A `Dataset` is one loaded version of the data plus every table derived from
+#it; it is never modified after construction. Callbacks read the data through
+#`DatasetHandle.current`, which pins the version for the rest of the request
+#(flask.g), so a request that started before a swap finishes on the old
+#version. Each worker polls Data/ in a background thread; when a file changes
+#the store is brought up to date (etl.py or datastore.py, one worker at a
+#time), the new version is loaded next to the old one and swapped in with a
+#single assignment, then the swap listeners drop the caches of the old one.
+
+RELOAD_SECONDS = float(os.environ.get('GAPMINDER_RELOAD_SECONDS', 5))
+
+log = logging.getLogger(__name__)
+
+
+class Dataset:
+    def __init__(self, cube, version):
+        self.cube = cube
+        self.version = version
+        #indicator metadata and the budgeted cache of the columns, before anything reads them
+        self.registry = indicators.Registry(cube)
+        self.availability = Availability(cube)
+        self.aggregates = AggregateTables(cube)
+        self.table_index = TableIndex(cube)
+        self.range_stats = RangeStats(cube)
+        self.country_search = NameIndex(cube.countries)
+
+    @classmethod
+    def load(cls):
+        #version first: a store written in between is picked up by the next reload
+        version = indicators.version(datastore.dataset_version())
+        return cls(datastore.load_cube(), version)
+
+
+@contextmanager
+def store_lock():
+    #one process rebuilds the store, the others wait and find it fresh
+    os.makedirs(datastore.STORE_DIR, exist_ok = True)
+    with open(os.path.join(datastore.STORE_DIR, '.lock'), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def refresh_store():
+    #rebuild the store from the files that changed: the long csv when it was
+    #edited after the store was written, else the raw Gapminder files
+    with store_lock():
+        manifest = datastore.read_manifest()
+        csv = os.path.relpath(datastore.CSV_PATH, datastore.BASE_DIR)
+        if manifest is None or csv in manifest['sources']:
+            if not datastore.store_is_fresh(manifest):
+                datastore.build()
+            return
+        written = os.path.getmtime(os.path.join(datastore.STORE_DIR, datastore.MANIFEST))
+        if os.path.getmtime(datastore.CSV_PATH) > written:
+            datastore.build()
+        else:
+            etl.run()
+
+
+def signature(directory = datastore.DATA_DIR):
+    #cheap change detection: name, size and mtime of every csv in Data/
+    out = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.csv'):
+            st = os.stat(os.path.join(directory, name))
+            out.append((name, st.st_size, st.st_mtime_ns))
+    return out
+
+
+class DatasetHandle:
+    def __init__(self, loader = Dataset.load, interval = RELOAD_SECONDS):
+        self.loader = loader
+        self.interval = interval
+        self.listeners = []
+        self._current = loader()
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    @property
+    def current(self):
+        if flask.has_request_context():
+            self._ensure_watcher()
+            if 'dataset' not in flask.g:
+                flask.g.dataset = self._current
+            return flask.g.dataset
+        return self._current
+
+    def on_swap(self, func):
+        #func(old, new) runs after every swap
+        self.listeners.append(func)
+        return func
+
+    def reload(self):
+        #load the data on disk, swap it in when the version changed
+        with self._lock:
+            refresh_store()
+            new = self.loader()
+            old = self._current
+            if new.version == old.version:
+                return False
+            self._current = new
+        for func in self.listeners:
+            func(old, new)
+        return True
+
+    def _ensure_watcher(self):
+        #the thread is started in the serving process (preloaded masters fork the workers)
+        if not self.interval or self._watcher == os.getpid():
+            return
+        self._watcher = os.getpid()
+        threading.Thread(target = self._watch, name = 'dataset-watcher', daemon = True).start()
+
+    def _watch(self):
+        last = seen = signature()
+        while True:
+            time.sleep(self.interval)
+            current = signature()
+            #reload once the files stopped changing for an interval (copies in progress)
+            if current == seen and current != last:
+                try:
+                    self.reload()
+                    last = current
+                except Exception:
+                    #keep serving the loaded version, retried on the next poll
+                    log.exception('dataset reload failed, still serving version %s', self._current.version)
+            seen = current
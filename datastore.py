@@ -0,0 +1,230 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import schema
+from cube import DataCube, FORMAT_VERSION as CUBE_VERSION
+
+#Binary columnar store for the long gapminder table.
+#
+#`python datastore.py build` parses Data/gapminder_dd.csv once and writes every
+#column to its own .npy file under Data/store, next to a manifest.json holding
+#the schema and a fingerprint of the source csv. The app then memory-maps the
+#column files (no parsing, pages shared through the OS page cache) and only
+#falls back to the csv when the store is missing or older than the csv.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, 'Data')
+CSV_PATH = os.path.join(DATA_DIR, 'gapminder_dd.csv')
+STORE_DIR = os.path.join(DATA_DIR, 'store')
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 2
+
+#display names of the csv columns, in file order
+COLUMNS = ['Country', 'Year', 'Life Expectancy', 'Child Mortality (per 1000 born)', 'Income (per person)', 'Population',
+            'CO2 emission (tonnes per person)', 'Human Development Index', 'Number of HIV cases', 'Continent']
+
+
+#size/mtime are checked first, the sha1 only when they differ (eg. fresh checkout)
+def fingerprint(path, with_hash = True):
+    st = os.stat(path)
+    fp = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if with_hash:
+        with open(path, 'rb') as f:
+            fp['sha1'] = hashlib.sha1(f.read()).hexdigest()
+    return fp
+
+
+def is_fresh(recorded, path):
+    if not os.path.exists(path):
+        return False
+    current = fingerprint(path, with_hash = False)
+    if current['size'] != recorded.get('size'):
+        return False
+    if current['mtime_ns'] == recorded.get('mtime_ns'):
+        return True
+    return fingerprint(path)['sha1'] == recorded.get('sha1')
+
+
+def read_csv(path = CSV_PATH):
+    #round_trip parses '0.328' to the nearest double (the default parser can be 1 ulp off)
+    df = pd.read_csv(path, float_precision = 'round_trip')
+    df.columns = COLUMNS
+    return df
+
+
+def write_store(df, sources, store_dir = STORE_DIR):
+    os.makedirs(store_dir, exist_ok = True)
+    build = uuid.uuid4().hex[:8]
+    columns = []
+    for i, name in enumerate(df.columns):
+        col = df[name]
+        entry = {'name': name, 'file': 'col{:02d}_{}.npy'.format(i, build)}
+        if col.dtype == object:
+            codes, categories = pd.factorize(col, sort = False)
+            values = codes.astype(schema.CATEGORY_TYPE)
+            entry['categories'] = list(categories)
+        elif name == 'Year':
+            values = col.values.astype(schema.YEAR_TYPE)
+            entry['display'] = col.dtype.str
+        else:
+            entry['encoding'] = schema.infer(col.values)
+            entry['display'] = col.dtype.str
+            values = schema.encode(col.values, entry['encoding'])
+        entry['dtype'] = values.dtype.str
+        np.save(os.path.join(store_dir, entry['file']), np.ascontiguousarray(values))
+        columns.append(entry)
+
+    manifest = {
+        'version': FORMAT_VERSION,
+        'rows': len(df),
+        'columns': columns,
+        'sources': {os.path.relpath(p, BASE_DIR): fingerprint(p) for p in sources},
+    }
+    #swap the manifest atomically, readers holding old column files keep their mapping
+    tmp = os.path.join(store_dir, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent = 1)
+    os.replace(tmp, os.path.join(store_dir, MANIFEST))
+
+    keep = {c['file'] for c in columns} | {MANIFEST}
+    for name in os.listdir(store_dir):
+        if name.endswith('.npy') and name not in keep:
+            os.remove(os.path.join(store_dir, name))
+    return manifest
+
+
+def read_manifest(store_dir = STORE_DIR):
+    try:
+        with open(os.path.join(store_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def store_is_fresh(manifest):
+    return manifest is not None and all(
+        is_fresh(fp, os.path.join(BASE_DIR, path)) for path, fp in manifest['sources'].items())
+
+
+class Store:
+    #read-only view on a built store, every column is a np.memmap
+    def __init__(self, manifest, store_dir = STORE_DIR):
+        self.manifest = manifest
+        self.rows = manifest['rows']
+        self.columns = {}
+        self.entries = {}
+        for entry in manifest['columns']:
+            self.columns[entry['name']] = np.load(os.path.join(store_dir, entry['file']), mmap_mode = 'r')
+            self.entries[entry['name']] = entry
+
+    def values(self, name):
+        #decoded values of a column in its display dtype (strings for categorical columns)
+        values, entry = self.columns[name], self.entries[name]
+        if 'categories' in entry:
+            return np.asarray(entry['categories'], dtype = object)[values]
+        if 'encoding' in entry:
+            values = schema.decode(values, entry['encoding'])
+        return values.astype(entry['display'])
+
+    def frame(self):
+        return pd.DataFrame({name: self.values(name) for name in self.columns}, columns = list(self.columns))
+
+
+def open_store(store_dir = STORE_DIR):
+    manifest = read_manifest(store_dir)
+    if not store_is_fresh(manifest):
+        return None
+    return Store(manifest, store_dir)
+
+
+def build(csv_path = CSV_PATH, store_dir = STORE_DIR):
+    return write_store(read_csv(csv_path), [csv_path], store_dir)
+
+
+#dataframe used by the app: from the store when it is up to date, else from the csv
+def load_dataset():
+    store = open_store()
+    if store is None:
+        return read_csv()
+    return store.frame()
+
+
+#short id of the data the app serves, used to namespace derived caches
+def dataset_version():
+    manifest = read_manifest()
+    if store_is_fresh(manifest):
+        sources = manifest['sources']
+    else:
+        sources = {os.path.relpath(CSV_PATH, BASE_DIR): fingerprint(CSV_PATH)}
+    raw = json.dumps(sorted((path, fp['sha1']) for path, fp in sources.items()))
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+
+#cube of the current dataset, built once per dataset version and memory-mapped
+#read-only so every worker on the host shares one copy through the page cache
+def load_cube(store_dir = STORE_DIR):
+    directory = os.path.join(store_dir, 'cube{}-{}'.format(CUBE_VERSION, dataset_version()))
+    try:
+        return DataCube.load(directory)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    cube = DataCube.from_frame(load_dataset())
+    tmp = '{}.{}.tmp'.format(directory, uuid.uuid4().hex[:8])
+    try:
+        cube.save(tmp)
+        os.rename(tmp, directory)
+    except OSError:
+        #read-only checkout or another worker won the race
+        shutil.rmtree(tmp, ignore_errors = True)
+        if not os.path.isdir(directory):
+            return cube
+    for name in os.listdir(store_dir):
+        if name.startswith('cube') and os.path.join(store_dir, name) != directory and not name.endswith('.tmp'):
+            shutil.rmtree(os.path.join(store_dir, name), ignore_errors = True)
+    return DataCube.load(directory)
+
+
+def bench(repeat = 10):
+    def best(fn):
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+        return min(times) * 1000, sorted(times)[len(times) // 2] * 1000
+
+    if open_store() is None:
+        build()
+    for label, fn in [('csv (pd.read_csv + rename)', read_csv),
+                      ('store (open only)', open_store),
+                      ('store (open + DataFrame)', load_dataset)]:
+        print('{:<30} best {:8.2f} ms   median {:8.2f} ms'.format(label, *best(fn)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Build or benchmark the binary gapminder data store.')
+    parser.add_argument('command', choices = ['build', 'cube', 'bench'])
+    parser.add_argument('--repeat', type = int, default = 10)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        manifest = build()
+        print('wrote {} rows x {} columns to {}'.format(manifest['rows'], len(manifest['columns']), STORE_DIR))
+    elif args.command == 'cube':
+        cube = load_cube()
+        print('cube of {} countries x {} years x {} indicators, version {}'.format(
+            len(cube.countries), len(cube.years), len(cube.indicators), dataset_version()))
+    else:
+        bench(args.repeat)
@@ -0,0 +1,55 @@
+import numpy as np
+
+#Downsampling of the country comparison series.
+#
+#Each series is reduced to about one point per pixel of the plotted width with
+#min/max bucketing: the first and last samples plus the minimum and maximum of
+#equal buckets in between, so peaks and the envelope of the line survive. A
+#bucket without data keeps one missing sample and the line keeps its gap.
+#When the user zooms (the x range of relayoutData, see assets/gapminder.js),
+#the zoomed window gets the full point budget and the rest of the series a
+#quarter of it on each side, so the view is at full resolution once the
+#window holds fewer samples than pixels. Above GL_POINTS points in total the
+#traces switch to WebGL.
+
+DEFAULT_WIDTH = 1000
+POINTS_PER_PIXEL = 1
+GL_POINTS = 5000
+
+
+def minmax(y, points):
+    #ascending indices of at most `points` samples of y
+    n = len(y)
+    if n <= max(points, 2):
+        return np.arange(n)
+    buckets = max((points - 2) // 2, 1)
+    edges = np.linspace(1, n - 1, buckets + 1).astype(int)
+    size = np.diff(edges).max()
+    idx = np.minimum(edges[:-1, None] + np.arange(size)[None, :], (edges[1:] - 1)[:, None])
+    values = y[idx]
+    missing = np.isnan(values)
+    low = np.where(missing, np.inf, values).argmin(axis = 1)
+    high = np.where(missing, -np.inf, values).argmax(axis = 1)
+    rows = np.arange(buckets)
+    return np.unique(np.concatenate([[0], idx[rows, low], idx[rows, high], [n - 1]]))
+
+
+def points(view):
+    #point budget per series for the view stored by the browser
+    width = (view or {}).get('width') or DEFAULT_WIDTH
+    return int(width * POINTS_PER_PIXEL)
+
+
+def window_indices(x, y, view):
+    #indices of the samples to draw: the zoomed window at full budget, the rest coarser
+    budget = points(view)
+    window = (view or {}).get('range')
+    if not window:
+        return minmax(y, budget)
+    lo, hi = window
+    parts = []
+    for part, share in ((x < lo, budget // 4), ((x >= lo) & (x <= hi), budget), (x > hi, budget // 4)):
+        part = np.flatnonzero(part)
+        if len(part):
+            parts.append(part[minmax(y[part], share)])
+    return np.concatenate(parts)
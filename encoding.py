@@ -0,0 +1,92 @@
+import json
+import os
+import uuid
+
+import plotly
+from plotly.utils import PlotlyJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+#Encoding and compression of the responses.
+#
+#Dash serializes every callback response with plotly's PlotlyJSONEncoder,
+#which dumps the value, parses it back to turn NaN into null and dumps it
+#again. With orjson installed, `FastJSONEncoder` writes the same JSON in one
+#pass: numpy arrays natively, NaN as null, no separator spaces. Anything orjson
+#does not know (object arrays, components, ...) goes through plotly's
+#`default`. `install()` makes it the encoder of the Dash responses, the figure
+#cache and the static export use `dumps` directly. A `RawJSON` value (eg. a
+#figure from the cache) is written out as is, without parsing it back.
+#
+#Responses are compressed by Flask-Compress (brotli or gzip, negotiated with
+#Accept-Encoding) above GAPMINDER_COMPRESS_MIN_BYTES (default 1024).
+
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS if orjson else None
+ALGORITHMS = ['br', 'gzip']
+#brotli quality 4 is about as fast as gzip 6 and smaller
+BR_LEVEL = 4
+GZIP_LEVEL = 6
+MIN_BYTES = int(os.environ.get('GAPMINDER_COMPRESS_MIN_BYTES', 1024))
+
+#placeholder string of a RawJSON value while the rest is dumped
+RAW_MARK = 'raw-json-{}-'.format(uuid.uuid4().hex)
+
+_default = PlotlyJSONEncoder().default
+
+
+class RawJSON:
+    #already serialized JSON bytes
+    __slots__ = ['payload']
+
+    def __init__(self, payload):
+        self.payload = payload
+
+
+def dumps(value):
+    #utf-8 JSON bytes, the RawJSON values spliced in where their placeholders were dumped
+    fragments = []
+    def default(o):
+        if isinstance(o, RawJSON):
+            fragments.append(o.payload)
+            return '{}{}'.format(RAW_MARK, len(fragments) - 1)
+        return _default(o)
+    if orjson is None:
+        payload = json.dumps(value, cls = PlotlyJSONEncoder, default = default).encode()
+    else:
+        payload = orjson.dumps(value, default = default, option = OPTIONS)
+    for i, fragment in enumerate(fragments):
+        payload = payload.replace('"{}{}"'.format(RAW_MARK, i).encode(), fragment, 1)
+    return payload
+
+
+class FastJSONEncoder(PlotlyJSONEncoder):
+    def encode(self, o):
+        if self.indent is not None or self.sort_keys:
+            return super().encode(o)
+        return dumps(o).decode()
+
+    def default(self, o):
+        #pretty printed responses parse the raw JSON back
+        if isinstance(o, RawJSON):
+            return json.loads(o.payload)
+        return super().default(o)
+
+
+def install():
+    #Dash looks the encoder up on plotly.utils for every response
+    plotly.utils.PlotlyJSONEncoder = FastJSONEncoder
+
+
+def compress(server):
+    from flask_compress import Compress
+
+    server.config.update(
+        COMPRESS_ALGORITHM = ALGORITHMS,
+        COMPRESS_BR_LEVEL = BR_LEVEL,
+        COMPRESS_LEVEL = GZIP_LEVEL,
+        COMPRESS_MIN_SIZE = MIN_BYTES,
+    )
+    Compress(server)
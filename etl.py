@@ -0,0 +1,136 @@
+import argparse
+import functools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import datastore
+
+#Rebuilds the long gapminder table from the wide Gapminder csv files.
+#
+#Same steps as Gapminder_compreh_2019.ipynb: every indicator file is melted to
+#(country, year, value), the indicators are outer-joined on (country, year),
+#years after 2018 are dropped and the continents are inner-merged. Each
+#indicator is melted in its own process and cached under Data/store/etl
+#together with the fingerprint of its csv, so a rerun only re-melts the files
+#that changed. The result goes straight into the data store (datastore.py);
+#`--csv` also rewrites Data/gapminder_dd.csv.
+#
+#   python etl.py            # incremental
+#   python etl.py --force    # re-melt everything
+
+#indicator csv files and their column in the long table, in column order
+INDICATORS = [
+    ('life_expectancy_years.csv', 'lifeExp'),
+    ('child_mortality_0_5_year_olds_dying_per_1000_born.csv', 'child_mortality'),
+    ('income_per_person_gdppercapita_ppp_inflation_adjusted.csv', 'income'),
+    ('population_total.csv', 'population'),
+    ('co2_emissions_tonnes_per_person.csv', 'co2_emission'),
+    ('hdi_human_development_index.csv', 'hdi'),
+    ('people_living_with_hiv_number_all_ages.csv', 'hiv_num'),
+]
+CONTINENTS = 'Countries-Continents.csv'
+LAST_YEAR = 2018
+CACHE_DIR = os.path.join(datastore.STORE_DIR, 'etl')
+CACHE_INDEX = 'index.json'
+
+
+def source_path(name, data_dir = datastore.DATA_DIR):
+    return os.path.join(data_dir, name)
+
+
+def melt(path, column, cache_path):
+    #one indicator file -> (country, year) indexed frame, pickled for the parent
+    wide = pd.read_csv(path, float_precision = 'round_trip')
+    df = pd.melt(wide, id_vars = ['country'], var_name = 'year', value_name = column)
+    df = df.set_index(['country', 'year'])
+    df.to_pickle(cache_path)
+    return column
+
+
+def read_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, CACHE_INDEX)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def melt_all(data_dir = datastore.DATA_DIR, cache_dir = CACHE_DIR, workers = None, force = False):
+    #melted indicators in column order, re-melting only the changed files
+    os.makedirs(cache_dir, exist_ok = True)
+    index = read_index(cache_dir)
+    jobs = []
+    for name, column in INDICATORS:
+        cache_path = os.path.join(cache_dir, column + '.pkl')
+        recorded = index.get(column)
+        if force or recorded is None or not os.path.exists(cache_path) \
+                or not datastore.is_fresh(recorded, source_path(name, data_dir)):
+            jobs.append((source_path(name, data_dir), column, cache_path))
+
+    if jobs:
+        paths = {column: path for path, column, _ in jobs}
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            for column in pool.map(melt, *zip(*jobs)):
+                index[column] = datastore.fingerprint(paths[column])
+        tmp = os.path.join(cache_dir, CACHE_INDEX + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(index, f, indent = 1)
+        os.replace(tmp, os.path.join(cache_dir, CACHE_INDEX))
+
+    frames = [pd.read_pickle(os.path.join(cache_dir, column + '.pkl')) for _, column in INDICATORS]
+    return frames, [job[1] for job in jobs]
+
+
+def join(frames, continents_path):
+    df = functools.reduce(lambda df1, df2: df1.join(df2, on = ['country', 'year'], how = 'outer'), frames)
+    df = df.reset_index()
+    df['year'] = df.year.astype('int64')
+    df = df[df['year'] <= LAST_YEAR]
+
+    df_cont = pd.read_csv(continents_path)
+    df_cont['country'] = df_cont.Country
+    df_cont.drop(columns = ['Country'], inplace = True)
+    return df.merge(df_cont, on = ['country'])
+
+
+def sources(data_dir = datastore.DATA_DIR):
+    return [source_path(name, data_dir) for name, _ in INDICATORS] + [source_path(CONTINENTS, data_dir)]
+
+
+def run(data_dir = datastore.DATA_DIR, store_dir = datastore.STORE_DIR, workers = None, force = False, csv = False):
+    #returns the re-melted indicators, None when the store was already up to date
+    paths = sources(data_dir)
+    manifest = datastore.read_manifest(store_dir)
+    if not force and not csv and datastore.store_is_fresh(manifest) and \
+            sorted(manifest['sources']) == sorted(os.path.relpath(p, datastore.BASE_DIR) for p in paths):
+        return None
+
+    frames, melted = melt_all(data_dir, os.path.join(store_dir, 'etl'), workers, force)
+    df = join(frames, source_path(CONTINENTS, data_dir))
+    if csv:
+        df.to_csv(datastore.CSV_PATH, index = False)
+    df.columns = datastore.COLUMNS
+    datastore.write_store(df.reset_index(drop = True), paths, store_dir)
+    return melted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Melt and join the Gapminder csv files into the data store.')
+    parser.add_argument('--workers', type = int, help = 'melt processes (default: one per cpu)')
+    parser.add_argument('--force', action = 'store_true', help = 'ignore the fingerprints and re-melt every file')
+    parser.add_argument('--csv', action = 'store_true', help = 'also rewrite {}'.format(
+        os.path.relpath(datastore.CSV_PATH, datastore.BASE_DIR)))
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    melted = run(workers = args.workers, force = args.force, csv = args.csv)
+    elapsed = time.perf_counter() - t0
+    if melted is None:
+        print('store is up to date ({:.2f} s)'.format(elapsed))
+    else:
+        print('re-melted {} of {} indicators ({}), store written in {:.2f} s'.format(
+            len(melted), len(INDICATORS), ', '.join(melted) or 'none', elapsed))
@@ -0,0 +1,247 @@
+import argparse
+import gzip
+import inspect
+import itertools
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import datastore
+import encoding
+import tables
+
+#Static export of the overview and continent pages.
+#
+#Both pages only read bounded inputs (indicators, years, aggregations,
+#continents), so every figure and table their callbacks can return is rendered
+#ahead of time, one gzipped JSON file per node and input combination:
+#
+#   Data/store/export/<dataset version>/manifest.json
+#   Data/store/export/<dataset version>/cont_graph/<xaxis>/<yaxis>/<cont>/<year>.json.gz
+#
+#Path parts are the slugs listed in the manifest, so a static host can serve
+#the tree as is. The tables are exported for their first page, unsorted,
+#unfiltered and without a graph selection, which is what a control change
+#shows; other pages, sorts, filters and selections are computed by the app as
+#before. The app serves a node from the export of the loaded dataset version
+#when it has one (a file read), and renders it otherwise, eg. right after a
+#data reload.
+#
+#   python export.py build [--workers N]
+#   python export.py info
+
+EXPORT_DIR = os.environ.get('GAPMINDER_EXPORT_DIR', os.path.join(datastore.STORE_DIR, 'export'))
+MANIFEST = 'manifest.json'
+PAGES = ['overview_page', 'continent_page']
+#table inputs and graph selections are exported for these values only
+DEFAULTS = {'page_current': 0, 'page_size': tables.PAGE_SIZE, 'sort_by': [], 'filter_query': '', 'selection': None}
+#node renders per pool task
+CHUNK = 256
+#a missing export is looked for again after this many seconds
+RETRY_SECONDS = 30
+
+
+def slug(value):
+    return re.sub('[^0-9a-z]+', '-', str(value).lower()).strip('-')
+
+
+def domains(data):
+    #values of every bounded page input
+    from aggregates import STATS
+
+    cube = data.cube
+    return {
+        'xaxis': list(cube.indicators),
+        'yaxis': list(cube.indicators),
+        'year': [int(year) for year in cube.years],
+        'agg': [stat for stat, _ in STATS],
+        'cont': list(cube.continents),
+    }
+
+
+def render_chunk(page, node, params, combos, root):
+    #renders one node over a list of input combinations, returns (node, files, json bytes, gzip bytes, seconds)
+    import index
+
+    t0 = time.perf_counter()
+    outputs, names, func = [n for n in getattr(index, page).nodes if n[2].__name__ == node][0]
+    #the raw node, the figure cache is of no use for single renders
+    func = inspect.unwrap(func)
+    defaults = {name: value for name, value in DEFAULTS.items() if name in names}
+    raw = packed = 0
+    for combo in combos:
+        values = dict(defaults, **dict(zip(params, combo)))
+        payload = encoding.dumps(func(*[values[name] for name in names]))
+        path = os.path.join(root, node, *[slug(v) for v in combo]) + '.json.gz'
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        data = gzip.compress(payload, compresslevel = 9)
+        with open(path, 'wb') as f:
+            f.write(data)
+        raw += len(payload)
+        packed += len(data)
+    return node, len(combos), raw, packed, time.perf_counter() - t0
+
+
+def disk_usage(directory):
+    total = 0
+    for parent, _, files in os.walk(directory):
+        for name in files:
+            total += os.stat(os.path.join(parent, name)).st_blocks * 512
+    return total
+
+
+def build(directory = EXPORT_DIR, workers = None):
+    #renders the export of the dataset on disk, returns its manifest
+    os.environ['GAPMINDER_CACHE_DISK_BYTES'] = '0'
+    os.environ['GAPMINDER_RELOAD_SECONDS'] = '0'
+    import index
+
+    t0 = time.perf_counter()
+    data = index.datasets.current
+    values = domains(data)
+    root = os.path.join(directory, data.version)
+    tmp = '{}.{}.tmp'.format(root, uuid.uuid4().hex[:8])
+    os.makedirs(tmp)
+
+    nodes, jobs = {}, []
+    for page in PAGES:
+        for outputs, names, func in getattr(index, page).nodes:
+            params = [name for name in names if name not in DEFAULTS]
+            nodes[func.__name__] = {
+                'page': page,
+                'outputs': ['{}.{}'.format(o.component_id, o.component_property) for o in outputs],
+                'params': params,
+                'defaults': {name: DEFAULTS[name] for name in names if name in DEFAULTS},
+                'path': '/'.join([func.__name__] + ['{' + p + '}' for p in params]) + '.json.gz',
+                'files': 0, 'json_bytes': 0, 'gzip_bytes': 0, 'seconds': 0.0,
+            }
+            #last parameter outermost: the nodes sharing a memoized frame (continent, year) get
+            #all their axis pairs in a row
+            combos = [combo[::-1] for combo in itertools.product(*[values[p] for p in reversed(params)])]
+            for i in range(0, len(combos), CHUNK):
+                jobs.append((page, func.__name__, params, combos[i:i + CHUNK], tmp))
+
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        for node, files, raw, packed, seconds in pool.map(render_chunk, *zip(*jobs)):
+            spec = nodes[node]
+            spec['files'] += files
+            spec['json_bytes'] += raw
+            spec['gzip_bytes'] += packed
+            spec['seconds'] += seconds
+
+    manifest = {
+        'version': data.version,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'build_seconds': round(time.perf_counter() - t0, 2),
+        'files': sum(spec['files'] for spec in nodes.values()),
+        'json_bytes': sum(spec['json_bytes'] for spec in nodes.values()),
+        'gzip_bytes': sum(spec['gzip_bytes'] for spec in nodes.values()),
+        'disk_bytes': disk_usage(tmp),
+        'values': {name: {str(v): slug(v) for v in vs} for name, vs in values.items()},
+        'nodes': nodes,
+    }
+    with open(os.path.join(tmp, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent = 1)
+    shutil.rmtree(root, ignore_errors = True)
+    os.rename(tmp, root)
+    #exports of older versions are never served again
+    for name in os.listdir(directory):
+        if name != data.version and not name.endswith('.tmp'):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors = True)
+    return manifest
+
+
+class StaticExport:
+    #read side, used by the page callbacks; `version` returns the loaded dataset version
+    def __init__(self, version, directory = EXPORT_DIR):
+        self.version = version
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._manifests = {}
+        self._lock = threading.Lock()
+
+    def manifest(self, version):
+        #manifests of other versions are dropped, they are never served again
+        with self._lock:
+            manifest, checked = self._manifests.get(version, (None, 0.0))
+            if manifest is None and time.time() - checked > RETRY_SECONDS:
+                try:
+                    with open(os.path.join(self.directory, version, MANIFEST)) as f:
+                        manifest = json.load(f)
+                except (OSError, ValueError):
+                    pass
+                self._manifests = {version: (manifest, time.time())}
+            return manifest
+
+    def path(self, node, values):
+        #file of a node for the page input values, None when it was not exported
+        version = self.version()
+        manifest = self.manifest(version)
+        spec = manifest and manifest['nodes'].get(node)
+        if spec is None:
+            return None
+        for name, default in spec['defaults'].items():
+            if values[name] not in (default, None):
+                return None
+        parts = []
+        for name in spec['params']:
+            part = manifest['values'][name].get(str(values[name]))
+            if part is None:
+                return None
+            parts.append(part)
+        return os.path.join(self.directory, version, node, *parts) + '.json.gz'
+
+    def lookup(self, node, values):
+        #the exported output value, None to render it
+        path = self.path(node, values)
+        if path is not None:
+            try:
+                with gzip.open(path, 'rb') as f:
+                    value = json.loads(f.read())
+                self.hits += 1
+                return value
+            except OSError:
+                pass
+        self.misses += 1
+        return None
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def info(directory = EXPORT_DIR):
+    version = datastore.dataset_version()
+    try:
+        with open(os.path.join(directory, version, MANIFEST)) as f:
+            manifest = json.load(f)
+    except OSError:
+        print('no export of dataset version {} in {}'.format(version, directory))
+        return
+    print('export of dataset version {}, built {} in {:.1f} s'.format(
+        version, manifest['created'], manifest['build_seconds']))
+    print('{:<32} {:>8} {:>14} {:>14} {:>9}'.format('node', 'files', 'json bytes', 'gzip bytes', 'render s'))
+    for node, spec in manifest['nodes'].items():
+        print('{:<32} {:>8,} {:>14,} {:>14,} {:>9.1f}'.format(
+            node, spec['files'], spec['json_bytes'], spec['gzip_bytes'], spec['seconds']))
+    print('{:<32} {:>8,} {:>14,} {:>14,}'.format(
+        'total', manifest['files'], manifest['json_bytes'], manifest['gzip_bytes']))
+    print('on disk {:,} bytes'.format(manifest['disk_bytes']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Pre-render the bounded page callbacks to gzipped JSON.')
+    parser.add_argument('command', choices = ['build', 'info'])
+    parser.add_argument('--workers', type = int, help = 'render processes (default: one per cpu)')
+    parser.add_argument('--dir', default = EXPORT_DIR, help = 'export directory (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        manifest = build(args.dir, args.workers)
+        print('rendered {:,} files in {:.1f} s'.format(manifest['files'], manifest['build_seconds']))
+    info(args.dir)
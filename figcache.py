@@ -0,0 +1,226 @@
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import encoding
+
+#Server-side cache of serialized callback figures.
+#
+#Figures are stored as the JSON Dash would send, keyed on the callback name and
+#its input values, and a hit is returned as that JSON (encoding.RawJSON). A per-process LRU with a byte budget sits in front of a
+#directory store shared by every gunicorn worker on the host, so a figure
+#rendered by one worker is a file read for the others.
+#
+#Configuration (environment):
+#   GAPMINDER_CACHE_BYTES        in-memory budget per worker (default 64 MB)
+#   GAPMINDER_CACHE_DISK_BYTES   budget of the shared directory (default 256 MB, 0 disables it)
+#   GAPMINDER_CACHE_DIR          shared directory (default <tmp>/gapminder-figcache)
+
+MB = 1024 * 1024
+
+
+class MemoryLRU:
+    def __init__(self, max_bytes, size = len):
+        #size(value) -> bytes counted against the budget
+        self.max_bytes = max_bytes
+        self.size = size
+        self.bytes = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            payload = self._items.get(key)
+            if payload is not None:
+                self._items.move_to_end(key)
+            return payload
+
+    def set(self, key, payload):
+        size = self.size(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= self.size(old)
+            self._items[key] = payload
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last = False)
+                self.bytes -= self.size(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def keys(self):
+        with self._lock:
+            return list(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DiskLRU:
+    #one file per entry, recency is the file mtime (touched on every hit)
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        os.makedirs(directory, exist_ok = True)
+        self._bytes = self._scan()[1]
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        return entries, sum(e[1] for e in entries)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return payload
+
+    def set(self, key, payload):
+        if len(payload) > self.max_bytes:
+            return
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir = self.directory, suffix = '.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        #an overwritten entry gives its bytes back
+        try:
+            old = os.stat(path).st_size
+        except OSError:
+            old = 0
+        os.replace(tmp, path)
+        with self._lock:
+            self._bytes += len(payload) - old
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        #other workers write too, so rescan and trim to 90% of the budget
+        entries, total = self._scan()
+        for _, size, name in sorted(entries):
+            if total <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        self._bytes = total
+
+    def clear(self):
+        for _, _, name in self._scan()[0]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        self._bytes = 0
+
+
+class FigureCache:
+    def __init__(self, max_bytes = 64 * MB, directory = None, disk_bytes = 256 * MB, namespace = ''):
+        #a string, or a callable returning the namespace of the current request (eg. the data version)
+        self.namespace = namespace
+        self.memory = MemoryLRU(max_bytes)
+        self.disk = DiskLRU(directory, disk_bytes) if directory and disk_bytes > 0 else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, namespace = ''):
+        return cls(
+            max_bytes = int(os.environ.get('GAPMINDER_CACHE_BYTES', 64 * MB)),
+            directory = os.environ.get('GAPMINDER_CACHE_DIR',
+                                        os.path.join(tempfile.gettempdir(), 'gapminder-figcache')),
+            disk_bytes = int(os.environ.get('GAPMINDER_CACHE_DISK_BYTES', 256 * MB)),
+            namespace = namespace,
+        )
+
+    def key(self, name, args):
+        namespace = self.namespace() if callable(self.namespace) else self.namespace
+        raw = json.dumps([namespace, name, args], sort_keys = True, default = str)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, key):
+        payload = self.memory.get(key)
+        if payload is not None:
+            with self._lock:
+                self.hits += 1
+            return payload
+        if self.disk is not None:
+            payload = self.disk.get(key)
+            if payload is not None:
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                self.memory.set(key, payload)
+                return payload
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, payload):
+        self.memory.set(key, payload)
+        if self.disk is not None:
+            self.disk.set(key, payload)
+
+    def memoize(self, name):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                key = self.key(name, args)
+                payload = self.get(key)
+                if payload is not None:
+                    #sent as stored, the response encoder splices it in unparsed
+                    return encoding.RawJSON(payload)
+                figure = func(*args)
+                self.set(key, encoding.dumps(figure))
+                return figure
+            return wrapper
+        return decorator
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        with self._lock:
+            hits, disk_hits, misses = self.hits, self.disk_hits, self.misses
+        return {
+            'hits': hits,
+            'disk_hits': disk_hits,
+            'misses': misses,
+            'entries': len(self.memory),
+            'bytes': self.memory.bytes,
+            'evictions': self.memory.evictions + (self.disk.evictions if self.disk else 0),
+        }
@@ -0,0 +1,199 @@
+import argparse
+import json
+import sys
+
+import numpy as np
+import plotly.io as pio
+from plotly.utils import PlotlyJSONEncoder
+
+#Lean figure construction for the callbacks.
+#
+#Figures are written as the plain dicts plotly would produce after validation
+#(nested `title.text`, `box.visible`, the default template in the layout, ...)
+#so the callbacks skip go.Figure's per-property validators and array copies;
+#numpy arrays are handed to Dash's JSON encoder as they are. Per-continent
+#trace templates are built once and only receive their arrays per request.
+#
+#`python figures.py check` feeds the figure of every builder for a set of
+#inputs through go.Figure and fails if plotly would serialize anything
+#differently. It only shows that plotly accepts the dicts as they are; that
+#they equal the figures of the go.* builders they replaced is tested against
+#golden figures in tests/test_figures.py.
+
+TEMPLATE = pio.templates[pio.templates.default].to_plotly_json()
+
+
+def axis(title = None, **kwargs):
+    out = {'showgrid': True, 'gridcolor': 'lightgray'}
+    if title is not None:
+        out['title'] = {'text': title}
+    out.update(kwargs)
+    return out
+
+
+def figure(data, layout):
+    layout = dict(layout)
+    layout['template'] = TEMPLATE
+    return {'data': data, 'layout': layout}
+
+
+def empty(text, layout):
+    #figure without traces and a centred message, for views without any value
+    layout = dict(layout, xaxis = {'visible': False}, yaxis = {'visible': False})
+    layout['annotations'] = [{'text': text, 'xref': 'paper', 'yref': 'paper', 'x': 0.5, 'y': 0.5,
+                                'showarrow': False, 'font': {'size': 16, 'color': 'gray'}}]
+    return figure([], layout)
+
+
+def trace(template, **arrays):
+    #shallow copy of a prebuilt trace with the request's arrays filled in
+    out = dict(template)
+    out.update(arrays)
+    return out
+
+
+class ContinentTemplates:
+    #scatter trace templates built once per continent colour
+    def __init__(self, con_col):
+        self.colors = dict(con_col)
+        self.lines = {cont: {
+            'type': 'scatter',
+            'mode': 'markers+lines',
+            'name': cont,
+            'marker': {'color': col},
+            'line': {'color': col},
+        } for cont, col in con_col.items()}
+
+    def line(self, cont, x, y):
+        return trace(self.lines[cont], x = x, y = y)
+
+
+def selected_lines(countries, x, values, name = 'Selected countries'):
+    #a line per country (rows of values), grouped out of the legend, hovering shows the country
+    x = np.asarray(x).astype(int)
+    return [{
+        'type': 'scatter',
+        'mode': 'lines',
+        'name': country,
+        'legendgroup': name,
+        'showlegend': False,
+        'x': x,
+        'y': values[i],
+        'hoverinfo': 'name+x+y',
+        'line': {'color': 'rgba(0, 0, 0, 0.5)', 'width': 1},
+    } for i, country in enumerate(countries)]
+
+
+#half widths of a precomputed violin and its box, in category units
+VIOLIN_WIDTH = 0.35
+BOX_WIDTH = 0.09
+
+
+def rounded(values, digits = 4):
+    #round to significant digits so the JSON carries short decimals
+    values = np.asarray(values, dtype = float)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        magnitude = np.floor(np.log10(np.abs(values)))
+    p = np.where(np.isfinite(magnitude), digits - 1 - magnitude, 0)
+    with np.errstate(over = 'ignore', invalid = 'ignore'):
+        up = np.round(values * 10.0 ** p) / 10.0 ** p
+        down = np.round(values / 10.0 ** -p) * 10.0 ** -p
+    return np.where(p >= 0, up, down)
+
+
+def segments(parts):
+    #join coordinate lists with None gaps, one trace draws several shapes
+    out = []
+    for part in parts:
+        out.extend(part)
+        out.append(None)
+    return out
+
+
+def violins(names, colors, stats, hovertext):
+    #scatter traces drawing precomputed violins (rangestats summaries) at x = 0, 1, ...:
+    #KDE outline, quartile box, whiskers/median/mean lines and outliers, one trace per colour and part
+    pos = np.arange(len(names))
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        half = stats['density'] / stats['density'].max(axis = 1, keepdims = True) * VIOLIN_WIDTH
+    outline_x = np.round(np.concatenate([pos[:, None] - half, (pos[:, None] + half)[:, ::-1]], axis = 1), 3).tolist()
+    outline_y = rounded(np.concatenate([stats['grid'], stats['grid'][:, ::-1]], axis = 1)).tolist()
+    q1, median, q3, mean, lower, upper = rounded([stats[k] for k in ('q1', 'median', 'q3', 'mean', 'lowerfence', 'upperfence')]).tolist()
+    left, right = np.round(pos - BOX_WIDTH, 3).tolist(), np.round(pos + BOX_WIDTH, 3).tolist()
+    lengths = [len(o) for o in stats['outliers']]
+    outliers = np.split(rounded(np.concatenate(stats['outliers'] + [[]])), np.cumsum(lengths)[:-1])
+
+    traces = []
+    for color in dict.fromkeys(colors):
+        rows = [i for i, c in enumerate(colors) if c == color and stats['count'][i]]
+        if not rows:
+            continue
+        box_x, box_y, line_x, line_y, outlier_x, outlier_y = ([] for _ in range(6))
+        for i in rows:
+            mean_half = float(np.interp(mean[i], stats['grid'][i], half[i]))
+            box_x.append([left[i], right[i], right[i], left[i], left[i]])
+            box_y.append([q1[i], q1[i], q3[i], q3[i], q1[i]])
+            line_x += [[i, i], [i, i], [left[i], right[i]], [round(i - mean_half, 3), round(i + mean_half, 3)]]
+            line_y += [[lower[i], q1[i]], [q3[i], upper[i]], [median[i], median[i]], [mean[i], mean[i]]]
+            outlier_x += [i] * lengths[i]
+            outlier_y += outliers[i].tolist()
+
+        base = {'type': 'scatter', 'mode': 'lines', 'showlegend': False, 'hoverinfo': 'skip'}
+        traces += [
+            dict(base, x = segments(outline_x[i] for i in rows), y = segments(outline_y[i] for i in rows),
+                fill = 'toself', line = {'color': color, 'width': 1, 'shape': 'spline'}),
+            dict(base, x = segments(box_x), y = segments(box_y), fill = 'toself', fillcolor = color,
+                line = {'color': color, 'width': 1}),
+            dict(base, x = segments(line_x), y = segments(line_y), line = {'color': 'white', 'width': 2}),
+            dict(base, mode = 'markers', x = rows, y = [median[i] for i in rows], marker = {'color': color, 'size': 0},
+                hovertext = [hovertext[i] for i in rows], hoverinfo = 'text'),
+            dict(base, mode = 'markers', x = outlier_x, y = outlier_y, marker = {'color': color, 'size': 6},
+                hoverinfo = 'y'),
+        ]
+    return traces
+
+
+#sample inputs of every figure builder in index.py, used by `check` and the benchmarks
+SAMPLES = {
+    'render_xaxis_graph': [('Life Expectancy', 'mean', None), ('Population', 'weighted', None),
+                            ('Number of HIV cases', 'count', [3, 40, 41, 120])],
+    'render_yaxis_graph': [('Income (per person)', 'median', None), ('Human Development Index', 'max', None)],
+    'render_cont_graph': [('Life Expectancy', 'Income (per person)', 'Asia', 2005),
+                            ('Population', 'CO2 emission (tonnes per person)', 'Oceania', 1950)],
+    'render_cont_pie_xaxis': [('Life Expectancy', 'Europe', 2005, None), ('Number of HIV cases', 'Africa', 1800, None)],
+    'render_cont_pie_yaxis': [('Income (per person)', 'Africa', 2005, None), ('Income (per person)', 'Africa', 2005, [0, 3, 7])],
+    'render_country_compare_cat': [(['Vietnam', 'Gabon', 'Tuvalu', 'Slovenia', 'Jamaica', 'Chile'], 'Income (per person)', None),
+                                    (['Chile'], 'Population', {'range': [1950, 2000], 'width': 400}),
+                                    ([], 'Life Expectancy', None)],
+    'render_large_graph': [([1995, 2005], ['Vietnam', 'Gabon', 'Tuvalu', 'Slovenia', 'Jamaica', 'Chile'], 'Income (per person)'),
+                            ([1800, 2018], ['Chile'], 'Human Development Index')],
+}
+
+
+def to_json(fig):
+    return json.loads(json.dumps(fig, cls = PlotlyJSONEncoder))
+
+
+def check(module, samples = SAMPLES):
+    import plotly.graph_objs as go
+
+    failures = 0
+    for name, cases in samples.items():
+        builder = getattr(module, name)
+        builder = getattr(builder, '__wrapped__', builder)
+        for args in cases:
+            lean = to_json(builder(*args))
+            validated = to_json(go.Figure(lean).to_plotly_json())
+            status = 'ok' if lean == validated else 'MISMATCH'
+            failures += status != 'ok'
+            print('{:<28} {:<70} {}'.format(name, repr(args)[:70], status))
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Check the lean figures against plotly.graph_objs.')
+    parser.add_argument('command', choices = ['check'])
+    parser.parse_args()
+
+    import index
+    sys.exit(1 if check(index) else 0)
@@ -0,0 +1,32 @@
+import os
+
+#Shared-data deployment: the app (and its dataset) is imported once in the
+#master and the workers are forked from it. The cube is memory-mapped
+#read-only from Data/store and the derived tables are never written after
+#import, so every worker reads the master's pages instead of holding a copy.
+#
+#   gunicorn -c gunicorn.conf.py index:server
+
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+bind = '0.0.0.0:' + os.environ.get('PORT', '8000')
+
+
+def when_ready(server):
+    #app loggers (eg. failed dataset reloads) write to gunicorn's error log, in the workers too
+    import logging
+    root = logging.getLogger()
+    root.handlers = list(server.log.error_log.handlers)
+    root.setLevel(server.log.error_log.level)
+
+    #move the preloaded objects out of the collector's reach, so collections in
+    #the workers do not touch (and copy) the master's pages
+    import gc
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
+def child_exit(server, worker):
+    #an exited worker's counters and gauges leave /metrics with it
+    import metrics
+    metrics.remove_process(worker.pid)
@@ -0,0 +1,33 @@
+from string import Formatter
+
+import numpy as np
+
+#Hover text built column-wise instead of row by row.
+#
+#A template keeps the str.format syntax the callbacks used with iterrows, but
+#array fields are converted to strings once and the pieces are joined with
+#numpy elementwise concatenation, so the output is identical to formatting
+#each row while the cost no longer grows with a Python loop per row.
+
+
+def as_text(values):
+    #same text as str() of every element: floats use the shortest repr, ints no decimals
+    return np.asarray(values).astype(str).astype(object)
+
+
+def render(template, **fields):
+    #fields are column arrays of equal length or plain strings shared by all rows
+    text = ''
+    for literal, field, _, _ in Formatter().parse(template):
+        text = text + literal
+        if field is not None:
+            value = fields[field]
+            text = text + (value if isinstance(value, str) else as_text(value))
+    return text.tolist()
+
+
+CONTINENT = 'Country: {country} <br>{xaxis}: {rowxaxis} <br>{yaxis}: {rowyaxis} <br>'
+COUNTRY = 'Country: {country} <br>{cat} : {rowcat} <br>Year: {year}'
+VIOLIN = ('Country: {country} <br>{cat} from {year1} to {year2}<br>max: {max}<br>upper fence: {upperfence}'
+        '<br>q3: {q3}<br>median: {median}<br>mean: {mean}<br>q1: {q1}<br>lower fence: {lowerfence}<br>min: {min}'
+        '<br>years with data: {count}')
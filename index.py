@@ -1,24 +1,60 @@
-import pandas as pd
+import copy
+import functools
+
 import numpy as np
 import dash
 import dash_table as dt
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output, State
-import plotly.graph_objs as go
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 from plotly.subplots import make_subplots
 
-app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
+import downsample
+import encoding
+import hover
+from figcache import FigureCache
+from aggregates import STATS, STAT_LABELS
+import tables
+from pagegraph import PageGraph
+from dataset import DatasetHandle
+from export import StaticExport
+import singleflight
+import figures
+import metrics
+
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], compress = False)
 server = app.server
 
+#one-pass JSON encoding of the responses, brotli/gzip above a size threshold (encoding.py)
+encoding.install()
+encoding.compress(server)
+
+#callback counts, latencies and response sizes on /metrics, wraps every callback registered below
+callback_metrics = metrics.instrument(app)
+
 app.config.suppress_callback_exceptions = True
 
-#import data
-df = pd.read_csv('Data/gapminder_dd.csv')
+#versioned data layer, every callback reads `datasets.current`: the cube (memory-mapped
+#read-only from Data/store, shared by the workers) and the tables derived from it.
+#Data/ is watched and a new version is swapped in without restarting (dataset.py)
+datasets = DatasetHandle()
+
+#cache of rendered figures, shared by the workers through a directory, keyed by data version
+figure_cache = FigureCache.from_env(namespace = lambda: datasets.current.version)
+callback_metrics.add_collector('figure_cache', figure_cache.stats)
+
+#pre-rendered overview and continent outputs of the loaded version, when `python export.py build` ran
+static_export = StaticExport(lambda: datasets.current.version)
+callback_metrics.add_collector('static_export', static_export.stats)
+
+#identical concurrent callback calls (eg. every visitor opening /) share one computation
+callback_flights = singleflight.coalesce(app, singleflight.SingleFlight(namespace = lambda: datasets.current.version))
+callback_metrics.add_collector('singleflight', callback_flights.stats)
 
-df.columns = ['Country', 'Year', 'Life Expectancy', 'Child Mortality (per 1000 born)', 'Income (per person)', 'Population', 
-            'CO2 emission (tonnes per person)', 'Human Development Index', 'Number of HIV cases', 'Continent']
+#derived tables of the indicators in use, per worker (indicators.py)
+callback_metrics.add_collector('indicator_cache', lambda: datasets.current.registry.cache.stats())
 
 
 #navbar 
@@ -34,15 +70,15 @@ navbar = dbc.NavbarSimple(
             dark=True
 )
 
-#body content for overview
-df_1 = df.drop(columns = ['Year', 'Country', 'Continent'])
+#body content for overview, the data dependent options are refreshed per version by page_bodies
+indicators = datasets.current.cube.indicators
 
 body_1 = dbc.Row ([
     dbc.Col([
             html.P('Select x-axis:'),
             dcc.Dropdown(
                 options = [
-                    {'label': i, 'value': i } for i in df_1.columns
+                    {'label': i, 'value': i } for i in indicators
                ],
                id='overview_xaxis',
                value = 'Life Expectancy'
@@ -51,7 +87,7 @@ body_1 = dbc.Row ([
             html.P('Select y-axis:'),
             dcc.Dropdown(
                 options = [
-                    {'label': i, 'value': i } for i in df_1.columns
+                    {'label': i, 'value': i } for i in indicators
                 ],
                 id='overview_yaxis',
                 value = 'Income (per person)'
@@ -63,7 +99,18 @@ body_1 = dbc.Row ([
                     {'label': i, 'value': i } for i in range(1800,2019)
                ],
                id ='overview_year',
-               value = 2005
+               value = 2005,
+               clearable = False
+            ),
+            html.Br(),
+            html.P('Continent trend:'),
+            dcc.RadioItems(
+                id = 'overview_agg',
+                options = [
+                    {'label': ' {}'.format(label), 'value': stat} for stat, label in STATS
+                ],
+                value = 'mean',
+                labelStyle = {'display':'block'}
             ),
     ],width = 3),
         
@@ -76,6 +123,14 @@ body_1 = dbc.Row ([
                         label='Data Visualization', 
                         tab_id='overview_visual',
                         children = [
+                            #per-year data of the selected axes, the graph is drawn client-side
+                            dcc.Store(
+                                    id = 'overview_frames'
+                            ),
+                            #country codes of the box/lasso selection on the overview graph
+                            dcc.Store(
+                                    id = 'overview_selection'
+                            ),
                             dcc.Graph(
                                     id = 'overview_graph'
                                 ),    
@@ -94,7 +149,14 @@ body_1 = dbc.Row ([
                         tab_id='overview_table',
                         children = dt.DataTable(
                             id = 'table_1',
-                            sort_action="native",
+                            page_action='custom',
+                            page_current=0,
+                            page_size=tables.PAGE_SIZE,
+                            sort_action='custom',
+                            sort_mode='single',
+                            sort_by=[],
+                            filter_action='custom',
+                            filter_query='',
                             style_cell={'textAlign': 'left', 'fontFamily' : 'Courier', 'fontSize':'11pt','textOverflow':'clip'},
                             style_as_list_view=True,
                             style_header={
@@ -140,7 +202,7 @@ body_2 = dbc.Row ([
         html.P('Select x-axis:'),
         dcc.Dropdown(
                 options = [
-                    {'label': i, 'value': i } for i in df_1.columns
+                    {'label': i, 'value': i } for i in indicators
                ],
                id='cont_xaxis',
                value = 'Life Expectancy'
@@ -149,7 +211,7 @@ body_2 = dbc.Row ([
             html.P('Select y-axis:'),
             dcc.Dropdown(
                 options = [
-                    {'label': i, 'value': i } for i in df_1.columns
+                    {'label': i, 'value': i } for i in indicators
                 ],
                 id='cont_yaxis',
                 value = 'Income (per person)'
@@ -159,7 +221,7 @@ body_2 = dbc.Row ([
             dcc.RadioItems(
                 id = 'cont',
                 options=[
-                    {'label': ' {}'.format(cont), 'value': cont} for cont in df['Continent'].unique()
+                    {'label': ' {}'.format(cont), 'value': cont} for cont in datasets.current.cube.continents
                 ],
                 value='Asia',
                 labelStyle = {'display':'block'}
@@ -171,7 +233,8 @@ body_2 = dbc.Row ([
                     {'label': i, 'value': i } for i in range(1800,2019)
                 ],
                 id ='cont_year',
-                value = 2005
+                value = 2005,
+                clearable = False
             ),      
         ],width = 3),
     dbc.Col([
@@ -187,6 +250,10 @@ body_2 = dbc.Row ([
                             dcc.Graph(
                                 id = 'cont_graph'
                             ),    
+                            #country codes of the box/lasso selection, shown by the pies
+                            dcc.Store(
+                                id = 'cont_selection'
+                            ),
                         ], width = 12),
                         html.Hr(style = {'width' : '95%'}),
                         dbc.Row([
@@ -208,7 +275,14 @@ body_2 = dbc.Row ([
                     tab_id='cont_table',
                     children = dt.DataTable(
                         id = 'table_2',
-                        sort_action="native",
+                        page_action='custom',
+                        page_current=0,
+                        page_size=tables.PAGE_SIZE,
+                        sort_action='custom',
+                        sort_mode='single',
+                        sort_by=[],
+                        filter_action='custom',
+                        filter_query='',
                         style_cell={'textAlign': 'left', 'fontFamily' : 'Courier', 'fontSize':'11pt','textOverflow':'clip'},
                         style_as_list_view=True,
                         style_header={
@@ -254,17 +328,19 @@ body_3 = [dbc.Row ([
         html.P('Select a catergory:'),
         dcc.RadioItems(
             id = 'country_cat',
-            options = [{'label': ' {}'.format(cat), 'value': cat} for cat in df_1.columns],
+            options = [{'label': ' {}'.format(cat), 'value': cat} for cat in indicators],
             labelStyle = {'display':'block'}, 
             value = 'Income (per person)'
         ),
         html.Br(),
         html.P('Select country:'),
+        #the options are the selected countries and the matches of the typed text (country_options)
         dcc.Dropdown(
             id = 'country',
-            options = [{'label': country, 'value': country} for country in df['Country'].sort_values().unique()],
+            options = [{'label': country, 'value': country} for country in ['Vietnam','Gabon','Tuvalu','Slovenia','Jamaica','Chile']],
             multi = True,
-            value = ['Vietnam','Gabon','Tuvalu','Slovenia','Jamaica','Chile']
+            value = ['Vietnam','Gabon','Tuvalu','Slovenia','Jamaica','Chile'],
+            placeholder = 'Type to search countries'
         ),    
     ],width = 3),
     dbc.Col([
@@ -275,6 +351,10 @@ body_3 = [dbc.Row ([
                     dbc.Col([
                         dcc.Graph(
                             id = 'country_compare_cat'
+                        ),
+                        #zoomed x range and width of the graph, sets the resolution of the series
+                        dcc.Store(
+                            id = 'country_compare_view'
                         )
                     ],width = 12),
                 ]      
@@ -283,7 +363,14 @@ body_3 = [dbc.Row ([
                 label='Data Table', 
                 children = dt.DataTable(
                     id = 'table_3',
-                    sort_action="native",
+                    page_action='custom',
+                    page_current=0,
+                    page_size=tables.PAGE_SIZE,
+                    sort_action='custom',
+                    sort_mode='single',
+                    sort_by=[],
+                    filter_action='custom',
+                    filter_query='',
                     style_cell={'textAlign': 'left', 'fontFamily' : 'Courier', 'fontSize':'11pt','textOverflow':'clip'},
                     style_as_list_view=True,
                     style_table = {'overflowY':'scroll'},
@@ -345,7 +432,88 @@ dbc.Row([
 ])]
 
 #Layout set up
-app.layout = html.Div([dcc.Location(id='url'),navbar, dbc.Container(id="page-content", className="pt-4")])
+#plotly's default template, sent once with the layout for the figures drawn client-side
+app.layout = html.Div([dcc.Location(id='url'), dcc.Store(id='plotly_template', data=figures.TEMPLATE),
+                        navbar, dbc.Container(id="page-content", className="pt-4")])
+
+def year_options(years):
+    return [{'label': i, 'value': i } for i in years]
+
+#a mark every decade
+def year_marks(first, last):
+    return {year : '{}'.format(year) for year in range(first + (-first) % 10, last + 1, 10)}
+
+#properties of the controls that depend on the data, by component id
+def data_props(data):
+    cube = data.cube
+    first, last = int(cube.years[0]), int(cube.years[-1])
+    indicator_options = {'options': [{'label': i, 'value': i } for i in cube.indicators]}
+    all_years = {'options': year_options(range(first, last + 1))}
+    return {
+        'overview_xaxis': indicator_options,
+        'overview_yaxis': indicator_options,
+        'overview_year': all_years,
+        'cont_xaxis': indicator_options,
+        'cont_yaxis': indicator_options,
+        'cont': {'options': [{'label': ' {}'.format(cont), 'value': cont} for cont in cube.continents]},
+        'cont_year': all_years,
+        'country_cat': {'options': [{'label': ' {}'.format(cat), 'value': cat} for cat in cube.indicators]},
+        'country_year': {'min': first, 'max': last, 'marks': year_marks(first, last)},
+    }
+
+#page bodies with the controls of a data version
+@functools.lru_cache(maxsize = 2)
+def page_bodies(data):
+    bodies = copy.deepcopy({'overview': html.Div(body_1), 'continent': html.Div(body_2), 'country': html.Div(body_3)})
+    props = data_props(data)
+    for body in bodies.values():
+        for component in body._traverse():
+            for prop, value in props.get(getattr(component, 'id', None), {}).items():
+                setattr(component, prop, value)
+    return {page: body.children for page, body in bodies.items()}
+
+#the year stays when it has data, else it moves to the closest year with data
+def closest_year(years, year):
+    if year is None or not len(years) or year in years:
+        return dash.no_update
+    return int(years[np.argmin(np.abs(years - year))])
+
+#the year dropdowns only offer the years with data for both axes
+@app.callback(
+    [Output('overview_year', 'options'), Output('overview_year', 'value')],
+    [Input('overview_xaxis', 'value'), Input('overview_yaxis', 'value')],
+    [State('overview_year', 'value')]
+)
+def overview_years(xaxis, yaxis, year):
+    years = datasets.current.availability.years([xaxis, yaxis])
+    return year_options(years), closest_year(years, year)
+
+@app.callback(
+    [Output('cont_year', 'options'), Output('cont_year', 'value')],
+    [Input('cont_xaxis', 'value'), Input('cont_yaxis', 'value'), Input('cont', 'value')],
+    [State('cont_year', 'value')]
+)
+def continent_years(xaxis, yaxis, cont, year):
+    availability = datasets.current.availability
+    years = availability.years([xaxis, yaxis], availability.continents[cont])
+    return year_options(years), closest_year(years, year)
+
+#the range slider spans the years with data for the category in the selected countries
+@app.callback(
+    [Output('country_year', 'min'), Output('country_year', 'max'), Output('country_year', 'marks'),
+    Output('country_year', 'value')],
+    [Input('country', 'value'), Input('country_cat', 'value')],
+    [State('country_year', 'value')]
+)
+def country_years(country, cat, years):
+    data = datasets.current
+    within = data.availability.bitset(data.cube.codes(country)) if country else None
+    available = data.availability.years([cat], within)
+    if not len(available):
+        raise PreventUpdate
+    first, last = int(available[0]), int(available[-1])
+    value = [min(max(years[0], first), last), min(max(years[1], first), last)]
+    return first, last, year_marks(first, last), value if value != years else dash.no_update
 
 #Server setup
 
@@ -367,12 +535,13 @@ def toggle_active_links(pathname):
 )
 
 def render_page_content(pathname):
+    bodies = page_bodies(datasets.current)
     if pathname in ["/", "/overview"]:
-        return body_1
+        return bodies['overview']
     elif pathname == "/continent":
-        return body_2
+        return bodies['continent']
     elif pathname == "/country":
-        return body_3
+        return bodies['country']
     # If the user tries to reach a different page, return a 404 message
     return dbc.Jumbotron(
         [
@@ -384,222 +553,286 @@ def render_page_content(pathname):
 
 #=======Rendering Overview Tab=========================================
 #call back for overview_graph
-continents = df['Continent'].unique()
 colors = ['salmon','green','orange','indigo','blue','red']
-con_col = dict(zip(continents, colors))
 
-@app.callback(
-    Output('overview_graph','figure'),
-    [Input('overview_xaxis','value'),
-    Input('overview_yaxis','value'),
-    Input('overview_year','value')]
+#continent colours and trace templates of a data version
+@functools.lru_cache(maxsize = 2)
+def continent_traces(data):
+    return figures.ContinentTemplates(dict(zip(data.cube.continents, colors)))
+
+#a new data version drops everything derived from the old one
+@datasets.on_swap
+def invalidate_caches(old, new):
+    for cached in (page_bodies, continent_traces, continent_frame.__wrapped__, country_frame.__wrapped__):
+        cached.cache_clear()
+    figure_cache.memory.clear()
+
+#every output of the overview page is updated by one callback
+overview_page = PageGraph(app,
+    xaxis = Input('overview_xaxis','value'),
+    yaxis = Input('overview_yaxis','value'),
+    year = Input('overview_year','value'),
+    agg = Input('overview_agg','value'),
+    page_current = Input('table_1', 'page_current'),
+    page_size = Input('table_1', 'page_size'),
+    sort_by = Input('table_1', 'sort_by'),
+    filter_query = Input('table_1', 'filter_query'),
+    selection = Input('overview_selection', 'data'),
 )
-#function to render overview graph
-def render_overview_graph(xaxis, yaxis, year):
+
+#compact data of every year for the selected axes, sent once per axis pair
+@overview_page.output(Output('overview_frames','data'))
+@figure_cache.memoize('overview_frames')
+def render_overview_frames(xaxis, yaxis):
+    data = datasets.current
+    cube = data.cube
+    #only the years where some country has both axes
+    y = data.availability.year_mask([xaxis, yaxis])
+    if not y.any():
+        return {'empty': figures.empty('No data for {} and {}'.format(xaxis, yaxis),
+                                        dict(paper_bgcolor = 'white', plot_bgcolor = 'white', height = 520))}
+    pop = cube.indicator('Population', slice(None), y)
+    #whole marker areas in units of the year's sizeref, at least 1 as plotly hides size 0
+    area = np.maximum(np.round(pop / (2*np.nanmax(pop, axis = 0)/(60.**2))), 1)
     traces = []
-    for cont,col in con_col.items():
-        df_year = df[df['Year'] == year]
-        df_year_cont = df_year[df_year['Continent'] == cont]
-        hover_text = []
-        for i, row in df_year_cont.iterrows():
-            hover_text.append(('Country: {country}<br>'+
-                            '{xaxis}: {rowxaxis} <br>'+
-                            '{yaxis}: {rowyaxis} <br>'+
-                                'Year: {year}').format(country=row['Country'],
-                                                    xaxis= xaxis,
-                                                    rowxaxis = row[xaxis],
-                                                    yaxis= yaxis,
-                                                    rowyaxis = row[yaxis],
-                                                    year=row['Year']))
-        trace = go.Scatter(
-            x = df_year_cont[xaxis],
-            y = df_year_cont[yaxis],
-            mode = 'markers',
-            marker = dict(symbol = 0, 
-                    color = col, 
-                    size  = df_year_cont['Population'],
-                    sizemode = 'area',
-                    sizeref  = 2*max(df_year['Population'])/(60.**2),
-                    sizemin = 5,
-                    opacity = 0.7),
-            name = cont,
-            hovertext = hover_text
-        )
-        traces.append(trace)
-    
-    layout = go.Layout(
-        xaxis = dict(title = xaxis,showgrid = True, gridcolor = 'lightgray'),
-        yaxis = dict(title = yaxis,showgrid = True, gridcolor = 'lightgray'),
-        paper_bgcolor = 'white',
-        plot_bgcolor = 'white',
-    )
-        
-    fig = go.Figure(data = traces, layout = layout)
-    
-    fig.update_layout(
-        height =  400,
-        margin = dict(t = 30)
-    )
-    return fig
+    for cont,col in continent_traces(data).colors.items():
+        rows = cube.continent_rows[cont]
+        traces.append({
+            'name': cont,
+            'color': col,
+            'country': cube.countries[rows],
+            'codes': np.arange(rows.start, rows.stop),
+            'x': cube.indicator(xaxis, rows, y).T,
+            'y': cube.indicator(yaxis, rows, y).T,
+            'size': area[rows].T,
+        })
+    return {
+        'xaxis': xaxis,
+        'yaxis': yaxis,
+        'x_int': cube.dtypes[xaxis].kind in 'iu',
+        'y_int': cube.dtypes[yaxis].kind in 'iu',
+        'years': cube.years[y],
+        'traces': traces,
+    }
 
-#call back for xaxis_graph vs year
-@app.callback(
-    Output('xaxis_graph', 'figure'),
-    [Input('overview_xaxis','value')]
+#scrubbing and playback of the overview graph never reach the server
+app.clientside_callback(
+    ClientsideFunction(namespace = 'gapminder', function_name = 'overviewFigure'),
+    Output('overview_graph','figure'),
+    [Input('overview_frames','data'),
+    Input('overview_year','value')],
+    [State('plotly_template','data')]
+)
+
+#box/lasso selections reach the server as the selected country codes only
+app.clientside_callback(
+    ClientsideFunction(namespace = 'gapminder', function_name = 'overviewSelection'),
+    Output('overview_selection', 'data'),
+    [Input('overview_graph', 'selectedData'), Input('overview_graph', 'figure')],
+    [State('overview_selection', 'data')]
 )
-def render_xaxis_graph(xaxis):
-    df_cont_year = df.groupby(['Continent','Year'])[xaxis].mean().reset_index()
+
+#the selected countries of the overview graph drawn over the continent trends
+def selection_lines(data, name, selection):
+    availability = data.availability
+    bits = availability.selection(selection)
+    if bits is None:
+        return []
+    codes = availability.codes(availability.with_data(name, bits))
+    countries = np.asarray(data.cube.countries, dtype = object)[codes]
+    return figures.selected_lines(countries, data.cube.years, data.cube.indicator(name, codes))
+
+#title of the trend graphs, the default mean keeps the plain title
+def trend_title(col, agg):
+    if agg == 'mean':
+        return '{} over year'.format(col)
+    return '{} over year ({})'.format(col, STAT_LABELS[agg].lower())
+
+#call back for xaxis_graph vs year
+@overview_page.output(Output('xaxis_graph', 'figure'))
+@figure_cache.memoize('xaxis_graph')
+def render_xaxis_graph(xaxis, agg, selection):
+    data = datasets.current
+    templates = continent_traces(data)
     traces = []
-    for cont,col in con_col.items():
-        trace = go.Scatter(
-            x = df_cont_year['Year'],
-            y = df_cont_year[df_cont_year['Continent']==cont][xaxis],
-            mode = 'markers+lines',
-            name = cont,
-            marker = dict(color = col),
-            line = dict(color = col),
+    for cont in templates.colors:
+        trace = templates.line(cont,
+            x = data.cube.years,
+            y = data.aggregates.table(agg, cont, xaxis),
         )
         traces.append(trace)
+    highlight = selection_lines(data, xaxis, selection)
+    if highlight:
+        traces = [dict(trace, opacity = 0.4) for trace in traces] + highlight
 
-    layout = go.Layout(
-        title = '{} over year'.format(xaxis),
-        yaxis = dict(title = xaxis,showgrid = True, gridcolor = 'lightgray'),
-        xaxis = dict(showgrid = True, gridcolor = 'lightgray'),
+    layout = dict(
+        title = dict(text = trend_title(xaxis, agg)),
+        yaxis = figures.axis(xaxis),
+        xaxis = figures.axis(),
         paper_bgcolor = 'white',
         plot_bgcolor = 'white',
-    )
-    
-    fig = go.Figure(data = traces, layout = layout)
-    
-    fig.update_layout(
         height =  400,
         margin = dict(t = 30)
-        
     )
-    return fig
+    return figures.figure(traces, layout)
 
 #call back for yaxis_graph vs year
-@app.callback(
-    Output('yaxis_graph', 'figure'),
-    [Input('overview_yaxis','value')]
-)
-def render_yaxis_graph(yaxis):
-    df_cont_year = df.groupby(['Continent','Year'])[yaxis].mean().reset_index()
+@overview_page.output(Output('yaxis_graph', 'figure'))
+@figure_cache.memoize('yaxis_graph')
+def render_yaxis_graph(yaxis, agg, selection):
+    data = datasets.current
+    templates = continent_traces(data)
     traces = []
-    for cont,col in con_col.items():
-        trace = go.Scatter(
-            x = df_cont_year['Year'],
-            y = df_cont_year[df_cont_year['Continent']==cont][yaxis],
-            mode = 'markers+lines',
-            name = cont,
-            marker = dict(color = col),
-            line = dict(color = col),
+    for cont in templates.colors:
+        trace = templates.line(cont,
+            x = data.cube.years,
+            y = data.aggregates.table(agg, cont, yaxis),
         )
         traces.append(trace)
+    highlight = selection_lines(data, yaxis, selection)
+    if highlight:
+        traces = [dict(trace, opacity = 0.4) for trace in traces] + highlight
 
-    layout = go.Layout(
-        title =  '{} over year'.format(yaxis), 
-        yaxis = dict(title = yaxis,showgrid = True, gridcolor = 'lightgray'),
-        xaxis = dict(showgrid = True, gridcolor = 'lightgray'),
+    layout = dict(
+        title = dict(text = trend_title(yaxis, agg)),
+        yaxis = figures.axis(yaxis),
+        xaxis = figures.axis(),
         paper_bgcolor = 'white',
         plot_bgcolor = 'white',
-    )
-    
-    fig = go.Figure(data = traces, layout = layout)
-    
-    fig.update_layout(
         height =  400,
         margin = dict(t = 30)
     )
-    return fig
+    return figures.figure(traces, layout)
+
+#country codes of a one-year table: sorted, restricted to `rows` and filtered
+@metrics.timed('filter')
+def year_table_rows(data, year, rows, sort_by, filter_query):
+    cube = data.cube
+    member = np.zeros(len(cube.countries), dtype = bool)
+    member[rows] = True
+    order = data.table_index.order(year, sort_by)
+    order = cube.rows_in_year(order[member[order]], year)
+    y = np.full(len(order), cube.year_index(year))
+    return order[tables.filter_mask(cube, order, y, filter_query)]
 
 #call back for data class of datatable
-@app.callback(
-    Output('table_1','data'),
-    [Input('overview_year','value'),
-    Input('overview_xaxis','value'),
-    Input('overview_yaxis','value'),
-    Input('table_1', 'page_current'),
-    Input('table_1', 'page_size')]
-)
-def render_data_overview_table(year,xaxis, yaxis, page_current, page_size):
-    df_year = df[df['Year']==year][['Country',xaxis, yaxis,'Continent']]
-    # df_year = df_year.iloc[page_current*page_size:(page_current+ 1)*page_size]
+@overview_page.output(Output('table_1','data'))
+def render_data_overview_table(year,xaxis, yaxis, page_current, page_size, sort_by, filter_query, selection):
+    #a cleared year has no rows, as the year filter of the long table had
+    if year is None:
+        return []
+    data = datasets.current
+    #the countries selected on the overview graph that have a record in the year
+    availability = data.availability
+    bits = availability.selection(selection)
+    if bits is not None:
+        rows = availability.codes(bits & availability.records[data.cube.year_index(year)])
+    else:
+        rows = slice(None)
+    rows = year_table_rows(data, year, rows, sort_by, filter_query)
+    df_year = data.cube.frame(tables.page(rows, page_current, page_size), year, ['Country',xaxis, yaxis,'Continent'])
     data = df_year.to_dict('records')    
     return data
 
 #call back for column class of datatable
-@app.callback(
-    Output('table_1','columns'),
-    [Input('overview_year','value'),
-    Input('overview_xaxis','value'),
-    Input('overview_yaxis','value')]
-)
-def render_columns_overview_table(year,xaxis, yaxis):
-    df_year = df[df['Year']==year][['Country',xaxis, yaxis,'Continent']]
-    columns = [{'id': c, 'name': c} for c in df_year.columns]  
+@overview_page.output(Output('table_1','columns'))
+def render_columns_overview_table(xaxis, yaxis):
+    columns = tables.columns(['Country',xaxis, yaxis,'Continent'])
     return columns
 
+overview_page.exported = static_export.lookup
+overview_page.register('overview_page')
+
 #+++++++---------------+++++++Rendering continent tab-----------------
-#call back for cont_graph 
-@app.callback(
-    Output('cont_graph','figure'),
-    [Input('cont_xaxis','value'),
-    Input('cont_yaxis','value'),
-    Input('cont','value'),
-    Input('cont_year','value')]
+continent_page = PageGraph(app,
+    xaxis = Input('cont_xaxis','value'),
+    yaxis = Input('cont_yaxis','value'),
+    cont = Input('cont','value'),
+    year = Input('cont_year','value'),
+    page_current = Input('table_2', 'page_current'),
+    page_size = Input('table_2', 'page_size'),
+    sort_by = Input('table_2', 'sort_by'),
+    filter_query = Input('table_2', 'filter_query'),
+    selection = Input('cont_selection', 'data'),
 )
 
+#countries of a continent in one year, only the indicators asked for are loaded
+@metrics.timed('filter')
+@functools.lru_cache(maxsize = 64)
+def continent_frame(data, cont, year, columns):
+    cube = data.cube
+    return cube.frame(cube.continent_rows[cont], year, ['Country', 'Year'] + list(columns))
+
+#call back for cont_graph 
+@continent_page.output(Output('cont_graph','figure'))
+@figure_cache.memoize('cont_graph')
+
 def render_cont_graph(xaxis,yaxis,cont,year):
-    df_cont_year = df[(df['Continent'] == cont) & (df['Year'] == year)]
-    hover_text = []
-    for i, row in df_cont_year.iterrows():
-        hover_text.append(('Country: {country} <br>'+
-                        '{xaxis}: {rowxaxis} <br>'+
-                        '{yaxis}: {rowyaxis} <br>').format(
-                            country = row['Country'],
-                            xaxis =  xaxis,
-                            rowxaxis = row[xaxis],
-                            yaxis = yaxis,
-                            rowyaxis = row[yaxis]))
+    cube, availability = datasets.current.cube, datasets.current.availability
+    if year is None or not availability.has_data([xaxis, yaxis], year, within = availability.continents[cont]):
+        return figures.empty('No data for {} and {} in {} in {}'.format(xaxis, yaxis, cont, year),
+                            dict(paper_bgcolor = 'white', plot_bgcolor = 'white', margin = dict(t = 30)))
+    df_cont_year = continent_frame(datasets.current, cont, year, (xaxis, yaxis, 'Population'))
+    hover_text = hover.render(hover.CONTINENT, country = df_cont_year['Country'].values,
+                            xaxis = xaxis, rowxaxis = df_cont_year[xaxis].values,
+                            yaxis = yaxis, rowyaxis = df_cont_year[yaxis].values)
     
-    data = [go.Scatter(
-        x = df_cont_year[xaxis],
-        y = df_cont_year[yaxis],
+    data = [dict(
+        type = 'scatter',
+        x = df_cont_year[xaxis].values,
+        y = df_cont_year[yaxis].values,
         mode = 'markers',
         marker = dict(symbol = 0, 
                     color = 'blue', 
-                    size  = df_cont_year['Population'],
+                    size  = df_cont_year['Population'].values,
                     sizemode = 'area',
                     sizeref  = 2*max(df_cont_year['Population'])/(40.**2),
                     sizemin  = 6),
-        hovertext = hover_text
+        hovertext = hover_text,
+        #country codes, what a box/lasso selection sends back
+        customdata = cube.rows_in_year(cube.continent_rows[cont], year)
     )]
 
-    layout = go.Layout(
-        xaxis = dict(title = xaxis, showgrid = True, gridcolor = 'lightgray'),
-        yaxis = dict(title = yaxis, showgrid = True, gridcolor = 'lightgray'),
+    layout = dict(
+        xaxis = figures.axis(xaxis),
+        yaxis = figures.axis(yaxis),
         paper_bgcolor = 'white',
         plot_bgcolor = 'white',
         margin = dict(t = 30) 
     )
+    return figures.figure(data, layout)
+
+app.clientside_callback(
+    ClientsideFunction(namespace = 'gapminder', function_name = 'contSelection'),
+    Output('cont_selection', 'data'),
+    [Input('cont_graph', 'selectedData'), Input('cont_graph', 'figure')],
+    [State('cont_selection', 'data')]
+)
 
-    figure = go.Figure(data = data, layout = layout)
-    return figure
+#countries of the pies: the ones selected on cont_graph with a value, else the whole continent
+def pie_frame(data, cont, year, name, selection):
+    availability = data.availability
+    bits = availability.selection(selection)
+    if bits is not None:
+        bits = availability.countries([name], data.cube.year_index(year), bits & availability.continents[cont])
+        if bits.any():
+            return data.cube.frame(availability.codes(bits), year, ['Country', 'Year', name])
+    return continent_frame(data, cont, year, (name,))
 
 #call back for cont_pie_xaxis
-@app.callback(
-    Output('cont_pie_xaxis','figure'),
-    [Input('cont_xaxis','value'),
-    Input('cont','value'),
-    Input('cont_year','value')]
-)
+@continent_page.output(Output('cont_pie_xaxis','figure'))
+@figure_cache.memoize('cont_pie_xaxis')
 
-def render_cont_pie_xaxis(xaxis, cont, year):
-    df_cont_year = df[(df['Continent']==cont) & (df['Year']==year)]
-    data = [go.Pie(
-        labels = df_cont_year['Country'],
-        values = df_cont_year[xaxis],
+def render_cont_pie_xaxis(xaxis, cont, year, selection):
+    availability = datasets.current.availability
+    if year is None or not availability.has_data([xaxis], year, within = availability.continents[cont]):
+        return figures.empty('No data in {}'.format(year), dict(
+            title = dict(text = '{} of {}'.format(xaxis,cont), yref = 'paper'), margin = dict(l=10, r=10, t=30,b=10)))
+    df_cont_year = pie_frame(datasets.current, cont, year, xaxis, selection)
+    data = [dict(
+        type = 'pie',
+        labels = df_cont_year['Country'].values,
+        values = df_cont_year[xaxis].values,
         showlegend = False,
         textinfo = 'label+value',
         hoverinfo = 'label+percent+value',
@@ -607,27 +840,27 @@ def render_cont_pie_xaxis(xaxis, cont, year):
         hole = 0.6,
         opacity = 0.85
     )] 
-    layout = go.Layout(
+    layout = dict(
         title = dict(text = '{} of {}'.format(xaxis,cont), yref = 'paper'),
         # width = 320,
         margin = dict(l=10, r=10, t=30,b=10)
     )
-    figure =  go.Figure(data = data, layout = layout)
-    return figure
+    return figures.figure(data, layout)
 
 #call back for cont_pie_yaxis
-@app.callback(
-    Output('cont_pie_yaxis','figure'),
-    [Input('cont_yaxis','value'),
-    Input('cont','value'),
-    Input('cont_year','value')]
-)
+@continent_page.output(Output('cont_pie_yaxis','figure'))
+@figure_cache.memoize('cont_pie_yaxis')
 
-def render_cont_pie_yaxis(yaxis, cont, year):
-    df_cont_year = df[(df['Continent']==cont) & (df['Year']==year)]
-    data = [go.Pie(
-        labels = df_cont_year['Country'],
-        values = df_cont_year[yaxis],
+def render_cont_pie_yaxis(yaxis, cont, year, selection):
+    availability = datasets.current.availability
+    if year is None or not availability.has_data([yaxis], year, within = availability.continents[cont]):
+        return figures.empty('No data in {}'.format(year), dict(
+            title = dict(text = '{} of {}'.format(yaxis,cont), yref = 'paper'), margin = dict(l=10, r=10, t=30,b=10)))
+    df_cont_year = pie_frame(datasets.current, cont, year, yaxis, selection)
+    data = [dict(
+        type = 'pie',
+        labels = df_cont_year['Country'].values,
+        values = df_cont_year[yaxis].values,
         showlegend = False,
         textinfo = 'label+value',
         hoverinfo = 'label+percent+value',
@@ -635,70 +868,107 @@ def render_cont_pie_yaxis(yaxis, cont, year):
         hole = .6,
         opacity = 0.85
     )] 
-    layout = go.Layout(
+    layout = dict(
         title = dict(text = '{} of {}'.format(yaxis,cont), yref = 'paper'),
         # width = 320,
         margin = dict(l=10, r=10, t=30,b=10)
     )
-    figure =  go.Figure(data = data, layout = layout)
-    return figure
+    return figures.figure(data, layout)
 
 #call back for cont table data class
-@app.callback(
-    Output('table_2','data'),
-    [Input('cont_xaxis','value'),
-    Input('cont_yaxis','value'),
-    Input('cont','value'),
-    Input('cont_year','value')]
-)
+@continent_page.output(Output('table_2','data'))
 
-def render_cont_table_data(xaxis, yaxis, cont, year):
-    df_cont_year = df[(df['Continent']==cont) & (df['Year'] == year)]
-    df_cont_year = df_cont_year[['Country','Year',xaxis,yaxis]]
+def render_cont_table_data(xaxis, yaxis, cont, year, page_current, page_size, sort_by, filter_query):
+    if year is None:
+        return []
+    data = datasets.current
+    rows = year_table_rows(data, year, data.cube.continent_rows[cont], sort_by, filter_query)
+    df_cont_year = data.cube.frame(tables.page(rows, page_current, page_size), year, ['Country','Year',xaxis,yaxis])
     data = df_cont_year.to_dict('records')
     return data
 
 #call back for cont table columns class
-@app.callback(
-    Output('table_2','columns'),
-    [Input('cont_xaxis','value'),
-    Input('cont_yaxis','value'),
-    Input('cont','value'),
-    Input('cont_year','value')]
-)
+@continent_page.output(Output('table_2','columns'))
 
-def render_cont_table_columns(xaxis, yaxis, cont, year):
-    df_cont_year = df[(df['Continent']==cont) & (df['Year'] == year)]
-    df_cont_year_column = df_cont_year[['Country','Year',xaxis,yaxis]]
-    columns = [{'id' : col, 'name':col} for col in df_cont_year_column.columns]
+def render_cont_table_columns(xaxis, yaxis):
+    columns = tables.columns(['Country','Year',xaxis,yaxis])
     return columns
 
+continent_page.exported = static_export.lookup
+continent_page.register('continent_page')
+
 #==================== Render country tab ============================
+country_page = PageGraph(app,
+    country = Input('country','value'),
+    cat = Input('country_cat','value'),
+    years = Input('country_year','value'),
+    view = Input('country_compare_view', 'data'),
+    page_current = Input('table_3', 'page_current'),
+    page_size = Input('table_3', 'page_size'),
+    sort_by = Input('table_3', 'sort_by'),
+    filter_query = Input('table_3', 'filter_query'),
+)
+
+#every year of one country for one indicator
+@metrics.timed('filter')
+@functools.lru_cache(maxsize = 256)
+def country_frame(data, country, cat):
+    cube = data.cube
+    return cube.frame_long([cube.country_code[country]], ['Country', 'Year', cat])
+
+#codes of the selected countries in table (file) order
+@metrics.timed('filter')
+def selected_rows(cube, countries):
+    rank = np.argsort(cube.file_order)
+    codes = cube.codes(countries)
+    return codes[np.argsort(rank[codes], kind = 'stable')]
+
+#search as you type: the selected countries plus the best matches of the typed text
+@app.callback(
+    Output('country', 'options'),
+    [Input('country', 'search_value')],
+    [State('country', 'value')]
+)
+def country_options(search_value, value):
+    if search_value is None:
+        raise PreventUpdate
+    selected = value or []
+    matches = datasets.current.country_search.search(search_value)
+    return [{'label': c, 'value': c} for c in selected + [m for m in matches if m not in selected]]
+
 # df_country = df[df['Country']=='Vietnam']['Population'].values
 # print(df_country)
 
-#call back to country_graph_cat
-@app.callback(
-    Output('country_compare_cat', 'figure'),
-    [Input('country','value'),
-    Input('country_cat','value')]
+#zoom and resize of the comparison graph, only x range and width changes reach the server
+app.clientside_callback(
+    ClientsideFunction(namespace = 'gapminder', function_name = 'compareView'),
+    Output('country_compare_view', 'data'),
+    [Input('country_compare_cat', 'relayoutData')],
+    [State('country_compare_view', 'data')]
 )
+
+#call back to country_graph_cat
+@country_page.output(Output('country_compare_cat', 'figure'))
 #rendering country_graph_cat1
-def render_country_compare_cat(country,cat):
+def render_country_compare_cat(country, cat, view):
+    dataset = datasets.current
+    if not dataset.availability.year_mask([cat], dataset.availability.bitset(dataset.cube.codes(country))).any():
+        return figures.empty('No data for {} in the selected countries'.format(cat), dict(
+            title = dict(text = '{cat} over year'.format(cat = cat), pad = dict(l = 0)),
+            paper_bgcolor = 'white', plot_bgcolor = 'white', margin = dict(t=60, b = 30), height =  400))
     data = []
     for c in country:
-        df_country = df[df['Country'] == c]
-        hover_text = []
-        for i, row in df_country.iterrows():
-            hover_text.append(('Country: {country} <br>'+
-                                '{cat} : {rowcat} <br>' +
-                                'Year: {year}').format(country=row['Country'],
-                                                    cat = cat,
-                                                    rowcat = row[cat],
-                                                    year=row['Year']))
-        trace = go.Scatter(
-            x = df_country['Year'],
-            y = df_country[cat],
+        df_country = country_frame(dataset, c, cat)
+        years, values = df_country['Year'].values, df_country[cat].values
+        #about one point per pixel, full resolution in the zoomed window
+        keep = downsample.window_indices(years, values.astype(float), view)
+        hover_text = hover.render(hover.COUNTRY, country = df_country['Country'].values[keep],
+                                cat = cat, rowcat = values[keep],
+                                year = years[keep])
+        trace = dict(
+            type = 'scatter',
+            x = years[keep],
+            y = values[keep],
             mode = 'markers+lines',
             marker = dict(size = 6),
             name = c,
@@ -707,95 +977,88 @@ def render_country_compare_cat(country,cat):
             fillcolor= 'rgba(169, 169, 169,0.1)'
         )
         data.append(trace) 
+    if sum(len(trace['x']) for trace in data) > downsample.GL_POINTS:
+        for trace in data:
+            trace['type'] = 'scattergl'
 
-    layout = go.Layout(
+    layout = dict(
         title = dict(text = '{cat} over year'.format(cat = cat), pad = dict(l = 0)),
-        xaxis = dict(showgrid = True, gridcolor = 'lightgray'),
-        yaxis = dict(title = cat, showgrid = True, gridcolor = 'lightgray'),
+        xaxis = figures.axis(),
+        yaxis = figures.axis(cat),
         paper_bgcolor = 'white',
         plot_bgcolor = 'white',
         margin = dict(t=60, b = 30),
         height =  400,
-        barmode = 'group'
+        barmode = 'group',
+        #the user's zoom survives the re-fetched series, a new category resets it
+        uirevision = cat
     )
-
-    figure = go.Figure(data = data, layout = layout)
-
-    return figure
+    return figures.figure(data, layout)
 
 #call back for country datatable data
-@app.callback(
-    Output('table_3','data'),
-    [Input('country','value'),
-    Input('country_cat', 'value')]
-)
+@country_page.output(Output('table_3','data'))
 
 #rendering data class of country datatable 
-def rendering_country_table_data(country, cat):
-    df_country = df[df['Country'].isin(country)][['Country','Year',cat,'Continent']]
+def rendering_country_table_data(country, cat, page_current, page_size, sort_by, filter_query):
+    dataset = datasets.current
+    cube = dataset.cube
+    with metrics.phase('filter'):
+        rows, y = cube.pairs(selected_rows(cube, country))
+        keep = tables.filter_mask(cube, rows, y, filter_query)
+        rows, y = rows[keep], y[keep]
+        order = tables.page(dataset.table_index.sort_pairs(rows, y, sort_by), page_current, page_size)
+    df_country = cube.frame_pairs(rows[order], y[order], ['Country','Year',cat,'Continent'])
     data = df_country.to_dict('records')
     return data
 
 #call back for country datatable columns
-@app.callback(
-    Output('table_3','columns'),
-    [Input('country','value'),
-    Input('country_cat','value')]
-)
+@country_page.output(Output('table_3','columns'))
 
 #rendering columns class of country datatable
 def rendering_country_table_column(country, cat):
-    df_country = df[df['Country'].isin(country)][['Country','Year',cat,'Continent']]
-    columns = [{'id':col, 'name': col} for col in df_country.columns]
+    columns = tables.columns(['Country','Year',cat,'Continent'])
     return columns
 
 #call back selected range   
-@app.callback(
-    Output('selected_years','children'),
-    [Input('country_year', 'value')]
-)
+@country_page.output(Output('selected_years','children'))
 #rendering selected range
-def render_range_year(value):
-    text = html.B('Selected range: {} to {}'.format(value[0],value[1]), 
+def render_range_year(years):
+    text = html.B('Selected range: {} to {}'.format(years[0],years[1]), 
                         style = {'color':'gray'})
     return text 
 
 #call back large graph (box plot)
-@app.callback(
-    Output('graph_large','figure'),
-    [Input('country_year','value'),
-    Input('country','value'),
-    Input('country_cat','value')]
-)
+@country_page.output(Output('graph_large','figure'))
 #rendering large graph (box plot)
-def render_large_graph(years, countries, cat):
-    data = []
-    year_range = list(range(years[0], years[1]+1))
-    for c in countries:
-        df_country = df[df['Country'] == c]
-        df_country_year = df_country[df_country['Year'].isin(year_range)]
-        trace = go.Violin(
-            y = df_country_year[cat],
-            x = df_country_year['Country'],
-            name = c,
-            box_visible = True,
-            meanline_visible=True,
-            jitter = 0.3
-        )
-        data.append(trace)
+def render_large_graph(years, country, cat):
+    #violins drawn from server-side summaries instead of every yearly value
+    dataset = datasets.current
+    title = dict(text = 'Comparison of {cat} from {year1} to {year2}'.format(cat = cat, year1 = years[0], year2=years[1]))
+    within = dataset.availability.bitset(dataset.cube.codes(country))
+    if not dataset.availability.has_data([cat], years[0], years[1], within):
+        return figures.empty('No data for {} in the selected countries'.format(cat), dict(
+            title = title, margin = dict (t = 80), paper_bgcolor = 'white', plot_bgcolor = 'white'))
+    stats = dataset.range_stats.summary(cat, dataset.cube.codes(country), years[0], years[1])
+    shown = {k: figures.rounded(stats[k]) for k in ('max', 'upperfence', 'q3', 'median', 'mean', 'q1', 'lowerfence', 'min')}
+    hover_text = hover.render(hover.VIOLIN, country = np.asarray(country, dtype = object), cat = cat,
+                                year1 = str(years[0]), year2 = str(years[1]), count = stats['count'], **shown)
+    colorway = figures.TEMPLATE['layout']['colorway']
+    colors = [colorway[i % len(colorway)] for i in range(len(country))]
+    data = figures.violins(country, colors, stats, hover_text)
     
-    layout = go.Layout(
-        title = dict(text = 'Comparison of {cat} from {year1} to {year2}'.format(cat = cat, year1 = years[0], year2=years[1])),
-        yaxis = dict(title = cat, showgrid = True, gridcolor = 'lightgray'),
-        xaxis = dict(showgrid = True, gridcolor = 'lightgray'),
+    layout = dict(
+        title = title,
+        yaxis = figures.axis(cat),
+        xaxis = figures.axis(tickvals = list(range(len(country))), ticktext = list(country), zeroline = False),
         margin = dict (t = 80),
         paper_bgcolor = 'white',
         plot_bgcolor = 'white',
         showlegend = False
     )
 
-    figure = go.Figure (data = data, layout = layout) 
-    return figure
+    return figures.figure(data, layout)
+
+country_page.register('country_page')
 
 
 #run app
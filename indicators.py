@@ -0,0 +1,246 @@
+import argparse
+import functools
+import hashlib
+import io
+import json
+import os
+import re
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import datastore
+import etl
+import schema
+from figcache import MemoryLRU, MB
+
+#Registry of the indicators and their lazily loaded columns.
+#
+#Every wide Gapminder csv in Data/ (a 'country' column, then one column per
+#year) is an indicator. The files of the long table (etl.INDICATORS) keep the
+#display names of datastore.COLUMNS and come with the cube; any other file is
+#added next to them under a name made from its file name. Nothing is read
+#before a callback asks for an indicator: the cube's columns are memory-mapped
+#read-only when it loads (cube.py), an added file is aligned to the cube's
+#countries and years, encoded (schema.py) and written once under
+#Data/store/indicators on first use, then mapped and kept mapped. Its store
+#file is named after the cube's grid and the content the version was loaded
+#with, so versions never read or overwrite each other's files. The tables
+#derived from every indicator (aggregates.py, tables.py, rangestats.py) share
+#one LRU per worker of GAPMINDER_INDICATOR_BYTES (default 64 MB), the coldest
+#are dropped above it and rebuilt on their next use.
+#
+#   python indicators.py list
+
+BUDGET = int(os.environ.get('GAPMINDER_INDICATOR_BYTES', 64 * MB))
+STORE_DIR = os.path.join(datastore.STORE_DIR, 'indicators')
+
+#display names of the long table's files, in column order
+NAMES = dict(zip([source for source, _ in etl.INDICATORS], datastore.COLUMNS[2:-1]))
+UNITS = {
+    'life_expectancy_years.csv': 'years',
+    'child_mortality_0_5_year_olds_dying_per_1000_born.csv': 'deaths per 1000 born',
+    'income_per_person_gdppercapita_ppp_inflation_adjusted.csv': 'GDP per person, PPP$ inflation adjusted',
+    'population_total.csv': 'people',
+    'co2_emissions_tonnes_per_person.csv': 'tonnes per person',
+    'hdi_human_development_index.csv': 'index',
+    'people_living_with_hiv_number_all_ages.csv': 'people',
+}
+#unit words ending the other Gapminder file names
+UNIT_SUFFIXES = [
+    ('_per_1000_born', 'per 1000 born'),
+    ('_tonnes_per_person', 'tonnes per person'),
+    ('_per_person', 'per person'),
+    ('_percent', '%'),
+    ('_years', 'years'),
+]
+#large numbers of the newer Gapminder files, eg. '1.2M'
+MULTIPLIERS = {'k': 1e3, 'M': 1e6, 'B': 1e9}
+
+
+class Indicator:
+    def __init__(self, name, source = None, unit = '', dtype = None):
+        self.name = name
+        #csv file in Data/, None for a column of the long table without one
+        self.source = source
+        self.unit = unit
+        #display dtype, known for an added file once it was loaded
+        self.dtype = dtype
+
+
+class IndicatorCache(MemoryLRU):
+    #derived tables of the indicators in use, by (kind, indicator)
+    def __init__(self, max_bytes = BUDGET):
+        super().__init__(max_bytes, size = lambda value: value.nbytes)
+        self.loads = 0
+
+    def fetch(self, key, build):
+        value = self.get(key)
+        if value is None:
+            value = build()
+            self.loads += 1
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        return {'entries': len(self), 'bytes': self.bytes, 'loads': self.loads, 'evictions': self.evictions}
+
+
+def is_indicator_file(path):
+    with open(path, encoding = 'utf-8') as f:
+        header = [h.strip().strip('"') for h in f.readline().split(',')]
+    return len(header) > 1 and header[0] == 'country' and all(h.isdigit() for h in header[1:])
+
+
+def describe(source):
+    #display name and unit of a file
+    if source in NAMES:
+        return NAMES[source], UNITS.get(source, '')
+    stem = os.path.splitext(source)[0]
+    unit = next((unit for suffix, unit in UNIT_SUFFIXES if stem.endswith(suffix)), '')
+    return stem.replace('_', ' ').capitalize(), unit
+
+
+def discover(data_dir = datastore.DATA_DIR):
+    #[(file, display name, unit)] of the indicator files, the long table's first
+    files = {name for name in os.listdir(data_dir) if name.endswith('.csv')
+                and is_indicator_file(os.path.join(data_dir, name))}
+    known = [name for name in NAMES if name in files]
+    added = sorted(files.difference(known), key = lambda name: describe(name)[0])
+    return [(name,) + describe(name) for name in known + added]
+
+
+def version(base, data_dir = datastore.DATA_DIR):
+    #dataset version with the added files, `base` alone when there are none
+    added = [source for source, _, _ in discover(data_dir) if source not in NAMES]
+    if not added:
+        return base
+    fingerprints = [(source, datastore.fingerprint(os.path.join(data_dir, source))['sha1']) for source in added]
+    return hashlib.sha1(json.dumps([base, fingerprints]).encode()).hexdigest()[:12]
+
+
+def numeric(frame):
+    #float values of a wide file, missing or unreadable cells are NaN
+    if all(dtype.kind in 'iuf' for dtype in frame.dtypes):
+        return frame.values.astype(float)
+    text = frame.astype(str).apply(lambda col: col.str.strip().str.replace('−', '-'))
+    multiplier = text.apply(lambda col: col.str[-1:].map(MULTIPLIERS).fillna(1.0))
+    values = text.apply(lambda col: pd.to_numeric(col.str.rstrip(''.join(MULTIPLIERS)), errors = 'coerce'))
+    return (values * multiplier).values.astype(float)
+
+
+def save_atomic(path, write):
+    tmp = '{}.{}.tmp'.format(path, uuid.uuid4().hex[:8])
+    with open(tmp, 'wb') as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+class Registry:
+    #indicators of a cube: its own columns plus the added files of Data/, loaded on first use
+    def __init__(self, cube, data_dir = datastore.DATA_DIR, store_dir = STORE_DIR, budget = BUDGET):
+        self.cube = cube
+        self.data_dir = data_dir
+        self.store_dir = store_dir
+        self.cache = cube.cache = IndicatorCache(budget)
+        #added files are stored per countries x years grid
+        grid = json.dumps([cube.countries, int(cube.years[0]), int(cube.years[-1])])
+        self.grid = hashlib.sha1(grid.encode()).hexdigest()[:8]
+
+        self.indicators = {name: Indicator(name, dtype = cube.dtypes[name].name) for name in cube.indicators}
+        #sha1 of the added files as this version sees them, as in `version`
+        self.sha1 = {}
+        for source, name, unit in discover(data_dir):
+            if name in self.indicators:
+                self.indicators[name].source = source
+                self.indicators[name].unit = unit
+            else:
+                self.indicators[name] = Indicator(name, source, unit)
+                self.sha1[name] = datastore.fingerprint(os.path.join(data_dir, source))['sha1']
+                cube.add_indicator(name, functools.partial(self.load, name))
+
+    def path(self, name):
+        stem = os.path.splitext(self.indicators[name].source)[0]
+        return os.path.join(self.store_dir, '{}-{}-{}'.format(stem, self.grid, self.sha1[name][:8]))
+
+    def prepare(self, name):
+        #{'encoding', 'dtype', 'source'} of an added file, converted when missing
+        try:
+            with open(self.path(name) + '.json') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return self.convert(name, os.path.join(self.data_dir, self.indicators[name].source))
+
+    def convert(self, name, source):
+        cube = self.cube
+        with open(source, 'rb') as f:
+            content = f.read()
+        if hashlib.sha1(content).hexdigest() != self.sha1[name]:
+            #the next reload brings the new content
+            raise ValueError('{} changed after this data version loaded'.format(source))
+        wide = pd.read_csv(io.BytesIO(content), float_precision = 'round_trip').drop_duplicates('country').set_index('country')
+        wide.columns = wide.columns.astype(int)
+        integer = all(dtype.kind in 'iu' for dtype in wide.dtypes)
+        wide = wide.reindex(index = cube.countries, columns = [int(year) for year in cube.years])
+        dense = numeric(wide)
+        meta = {
+            'name': name,
+            'encoding': schema.infer(dense),
+            'dtype': np.dtype(np.int64 if integer and not np.isnan(dense).any() else np.float64).str,
+            'source': datastore.fingerprint(source),
+        }
+        codes = np.ascontiguousarray(schema.encode(dense, meta['encoding']))
+
+        os.makedirs(self.store_dir, exist_ok = True)
+        base = self.path(name)
+        save_atomic(base + '.npy', lambda f: np.save(f, codes))
+        save_atomic(base + '.json', lambda f: f.write(json.dumps(meta, indent = 1).encode()))
+        #files of the same indicator for other grids or contents, mapped ones stay readable
+        stem = os.path.splitext(self.indicators[name].source)[0]
+        for other in os.listdir(self.store_dir):
+            key, _, ext = other.partition('.')
+            if re.fullmatch(re.escape(stem) + r'-[0-9a-f]{8}(-[0-9a-f]{8})?', key) and key != os.path.basename(base) \
+                    and ext in ('npy', 'json'):
+                try:
+                    os.remove(os.path.join(self.store_dir, other))
+                except OSError:
+                    pass
+        return meta
+
+    def load(self, name):
+        #codes of an added file, sets its encoding and dtype on the cube
+        meta = self.prepare(name)
+        self.cube.encodings[name] = meta['encoding']
+        self.cube.dtypes[name] = np.dtype(meta['dtype'])
+        self.indicators[name].dtype = self.cube.dtypes[name].name
+        return np.load(self.path(name) + '.npy', mmap_mode = 'r')
+
+    def info(self):
+        mapped = {name for name, source in self.cube.columns.sources.items() if not callable(source)}
+        return [{'name': ind.name, 'unit': ind.unit, 'dtype': ind.dtype, 'source': ind.source,
+                    'loaded': ind.name in mapped} for ind in self.indicators.values()]
+
+    def __iter__(self):
+        return iter(self.indicators.values())
+
+    def __len__(self):
+        return len(self.indicators)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'List the indicators of the data store and of Data/.')
+    parser.add_argument('command', choices = ['list'])
+    parser.add_argument('--load', action = 'store_true', help = 'load every indicator (converts the added files)')
+    args = parser.parse_args()
+
+    registry = Registry(datastore.load_cube())
+    if args.load:
+        for indicator in registry:
+            registry.cube.indicator(indicator.name)
+    print('{:<36} {:<40} {:<8} {}'.format('indicator', 'unit', 'dtype', 'file'))
+    for row in registry.info():
+        print('{:<36} {:<40} {:<8} {}'.format(row['name'][:36], row['unit'][:40], row['dtype'] or '?', row['source'] or '-'))
+    stats = registry.cache.stats()
+    print('\n{} indicators, {} cached arrays, {:,} bytes of {:,}'.format(
+        len(registry), stats['entries'], stats['bytes'], registry.cache.max_bytes))
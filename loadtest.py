@@ -0,0 +1,282 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+#the servers get the caller's environment, not the settings bench.py makes for itself
+SERVER_ENV = dict(os.environ)
+
+#Load test of the Dash callbacks against a local gunicorn.
+#
+#Traffic is synthesized from the callbacks registered in index.py. A simulated
+#visit opens a page (/, /continent or /country) the way the browser does: the
+#navbar and page content callbacks, then the page callback with every input
+#fired. It then changes one control at a time (axis, year, aggregation,
+#continent, countries, year range, zoom, graph selection, table page or sort)
+#to values that control offers; country visits also type a few letters in the
+#country search.
+#`--save` writes the generated visits, `--traffic` replays a saved file
+#instead, eg. one edited by hand or built from requests captured in the
+#browser.
+#
+#For every worker class x worker count x client concurrency, gunicorn is
+#started with gunicorn.conf.py on a free local port. The visits are replayed
+#by `concurrency` client threads, each sending its requests one after the other
+#like a browser tab, for --warmup and then --duration seconds. The report gives
+#throughput, latency percentiles and the error rate (connection errors and
+#HTTP >= 400; 204 is Dash's "no update").
+#
+#   python loadtest.py --workers 1,2,4 --worker-class sync,gthread --concurrency 4,16
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGES = ['/', '/continent', '/country']
+#interactions per visit after the page load
+INTERACTIONS = 6
+DISPATCH = '/_dash-update-component'
+
+
+def domains():
+    #values every page control can take, read from the app
+    import bench
+    import export
+
+    data = bench.index.datasets.current
+    values = export.domains(data)
+    values['countries'] = sorted(data.cube.countries)
+    return bench, values
+
+
+def interaction(rng, values, props, state):
+    #one control change on the page of `props`, returns the changed prop ids
+    choices = [p for p in props if p.split('.')[0] in
+               ('overview_xaxis', 'overview_yaxis', 'overview_year', 'overview_agg', 'cont_xaxis', 'cont_yaxis',
+                'cont', 'cont_year', 'country', 'country_cat', 'country_year', 'country_compare_view',
+                'overview_selection', 'cont_selection')
+               or p.endswith('.page_current') or p.endswith('.sort_by')]
+    prop = rng.choice(choices)
+    component, name = prop.split('.')
+    if component.endswith('xaxis') or component.endswith('yaxis') or component == 'country_cat':
+        state[prop] = rng.choice(values['xaxis'])
+    elif component.endswith('_year') and component != 'country_year':
+        state[prop] = rng.choice(values['year'])
+    elif component == 'overview_agg':
+        state[prop] = rng.choice(values['agg'])
+    elif component == 'cont':
+        state[prop] = rng.choice(values['cont'])
+    elif component == 'country':
+        state[prop] = rng.sample(values['countries'], rng.randint(1, 12))
+    elif component == 'country_year':
+        first, last = sorted(rng.sample(values['year'], 2))
+        state[prop] = [first, last]
+    elif component == 'country_compare_view':
+        state[prop] = {'range': sorted(rng.sample(values['year'], 2)), 'width': rng.choice([600, 800, 1000])}
+    elif component.endswith('_selection'):
+        #box/lasso selection of a few countries, or a cleared one
+        state[prop] = rng.choice([None, rng.sample(range(len(values['countries'])), rng.randint(1, 30))])
+    elif name == 'page_current':
+        state[prop] = rng.randint(0, 5)
+    else:
+        column = rng.choice(['Country'] + values['xaxis'])
+        state[prop] = [{'column_id': column, 'direction': rng.choice(['asc', 'desc'])}]
+    return [prop]
+
+
+def synthesize(visits = 200, seed = 0):
+    #[{'page': path, 'requests': [dispatch body, ...]}, ...]
+    bench, values = domains()
+    rng = random.Random(seed)
+    callbacks = {output: spec for output, spec in bench.index.app.callback_map.items() if 'callback' in spec}
+    navigation = [o for o, spec in callbacks.items() if [i['id'] for i in spec['inputs']] == ['url']]
+    out = []
+    for _ in range(visits):
+        page = rng.choice(PAGES)
+        state = dict(bench.DEFAULTS, **{'url.pathname': page})
+        requests = [bench.request_body(o, callbacks[o], state, ['url.pathname']) for o in navigation]
+        #the page callback is the widest one reading the page's first control
+        first = {'/': 'overview_xaxis.value', '/continent': 'cont_xaxis.value', '/country': 'country.value'}[page]
+        output, spec = max([(o, s) for o, s in callbacks.items()
+                            if first in ['{}.{}'.format(i['id'], i['property']) for i in s['inputs']]],
+                           key = lambda item: len(item[1]['inputs']))
+        props = ['{}.{}'.format(i['id'], i['property']) for i in spec['inputs']]
+        requests.append(bench.request_body(output, spec, state, props))
+        if page == '/country':
+            typed = rng.choice(values['countries'])
+            for n in range(1, rng.randint(2, 4)):
+                state['country.search_value'] = typed[:n]
+                requests.append(bench.request_body('country.options', callbacks['country.options'], state,
+                                                    ['country.search_value']))
+        for _ in range(INTERACTIONS):
+            changed = interaction(rng, values, props, state)
+            requests.append(bench.request_body(output, spec, state, changed))
+        out.append({'page': page, 'requests': requests})
+    return out
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    #gunicorn serving index:server on a local port for the lifetime of the `with` block
+    def __init__(self, workers, worker_class, threads, timeout = 180):
+        self.port = free_port()
+        self.command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                        '--workers', str(workers), '--worker-class', worker_class, '--threads', str(threads),
+                        '--bind', '127.0.0.1:{}'.format(self.port), '--log-level', 'warning', 'index:server']
+        self.timeout = timeout
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, cwd = BASE_DIR, env = SERVER_ENV)
+        deadline = time.time() + self.timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('gunicorn exited with {}'.format(self.process.returncode))
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout = 5)
+                conn.request('GET', '/_dash-layout')
+                if conn.getresponse().status == 200:
+                    return self
+            except OSError:
+                time.sleep(0.5)
+        self.__exit__()
+        raise RuntimeError('gunicorn did not answer within {} s'.format(self.timeout))
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def client(port, visits, seed, deadline, results, accept_encoding):
+    #one browser tab: visits in random order, requests of a visit in sequence
+    rng = random.Random(seed)
+    headers = {'Content-Type': 'application/json'}
+    if accept_encoding:
+        headers['Accept-Encoding'] = accept_encoding
+    conn = None
+    while time.time() < deadline:
+        for body in rng.choice(visits)['requests']:
+            if time.time() >= deadline:
+                break
+            payload = json.dumps(body).encode()
+            t0 = time.perf_counter()
+            try:
+                if conn is None:
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout = 60)
+                conn.request('POST', DISPATCH, payload, headers)
+                response = conn.getresponse()
+                size = len(response.read())
+                status = response.status
+                if response.will_close:
+                    conn.close()
+                    conn = None
+            except (OSError, http.client.HTTPException):
+                status, size = 0, 0
+                if conn is not None:
+                    conn.close()
+                conn = None
+            results.append((time.perf_counter() - t0, status, size))
+
+
+def replay(port, visits, concurrency, seconds, accept_encoding = None, seed = 0):
+    #[(seconds, status, bytes), ...] of the requests sent in `seconds`
+    results = []
+    deadline = time.time() + seconds
+    threads = [threading.Thread(target = client, args = (port, visits, seed + i, deadline, results, accept_encoding))
+               for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def summarize(results, seconds):
+    ms = np.asarray([r[0] for r in results]) * 1000
+    errors = sum(1 for r in results if r[1] == 0 or r[1] >= 400)
+    return {
+        'requests': len(results),
+        'throughput': len(results) / seconds,
+        'p50_ms': float(np.percentile(ms, 50)) if len(ms) else None,
+        'p95_ms': float(np.percentile(ms, 95)) if len(ms) else None,
+        'p99_ms': float(np.percentile(ms, 99)) if len(ms) else None,
+        'error_rate': errors / len(results) if results else 1.0,
+        'bytes_per_s': sum(r[2] for r in results) / seconds,
+    }
+
+
+def run(visits, workers, worker_classes, concurrencies, threads = 4, duration = 20, warmup = 5,
+        accept_encoding = None):
+    rows = []
+    for worker_class in worker_classes:
+        for n in workers:
+            with Server(n, worker_class, threads) as server:
+                for concurrency in concurrencies:
+                    replay(server.port, visits, concurrency, warmup, accept_encoding)
+                    results = replay(server.port, visits, concurrency, duration, accept_encoding)
+                    row = dict(worker_class = worker_class, workers = n,
+                                threads = threads if worker_class == 'gthread' else 1,
+                                concurrency = concurrency, **summarize(results, duration))
+                    report([row], header = not rows)
+                    rows.append(row)
+    return rows
+
+
+def report(rows, header = True):
+    if header:
+        print('{:<8} {:>7} {:>7} {:>11} {:>9} {:>8} {:>8} {:>8} {:>8} {:>7} {:>9}'.format(
+            'class', 'workers', 'threads', 'concurrency', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms',
+            'errors', 'KB/s'))
+    for r in rows:
+        print('{:<8} {:>7} {:>7} {:>11} {:>9} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>6.1%} {:>9.0f}'.format(
+            r['worker_class'], r['workers'], r['threads'], r['concurrency'], r['requests'], r['throughput'],
+            r['p50_ms'] or 0, r['p95_ms'] or 0, r['p99_ms'] or 0, r['error_rate'], r['bytes_per_s'] / 1024))
+
+
+def int_list(text):
+    return [int(v) for v in text.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Replay Dash callback traffic against local gunicorn servers.')
+    parser.add_argument('--workers', type = int_list, default = [1, 2, 4], help = 'worker counts (default: 1,2,4)')
+    parser.add_argument('--worker-class', default = 'sync,gthread', help = 'gunicorn worker classes (default: %(default)s)')
+    parser.add_argument('--threads', type = int, default = 4, help = 'threads per gthread worker (default: 4)')
+    parser.add_argument('--concurrency', type = int_list, default = [4, 16], help = 'client threads (default: 4,16)')
+    parser.add_argument('--duration', type = float, default = 20, help = 'measured seconds per run (default: 20)')
+    parser.add_argument('--warmup', type = float, default = 5, help = 'unmeasured seconds before each run (default: 5)')
+    parser.add_argument('--visits', type = int, default = 200, help = 'synthesized visits (default: 200)')
+    parser.add_argument('--accept-encoding', default = 'br, gzip', help = "request header (default: '%(default)s')")
+    parser.add_argument('--traffic', help = 'replay the visits of this JSON file instead of synthesizing them')
+    parser.add_argument('--save', help = 'write the synthesized visits to this JSON file and exit')
+    parser.add_argument('--output', help = 'write the results as JSON')
+    args = parser.parse_args()
+
+    if args.traffic:
+        with open(args.traffic) as f:
+            visits = json.load(f)
+    else:
+        visits = synthesize(args.visits)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(visits, f)
+        sys.exit()
+
+    rows = run(visits, args.workers, args.worker_class.split(','), args.concurrency, args.threads,
+               args.duration, args.warmup, args.accept_encoding)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': rows}, f, indent = 1)
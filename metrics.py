@@ -0,0 +1,343 @@
+import functools
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import flask
+from dash.exceptions import PreventUpdate
+
+#Per-callback instrumentation exposed in Prometheus text format on /metrics.
+#
+#`instrument(app)` wraps app.callback so every server callback registered
+#afterwards records its call count, response bytes and latency histograms for
+#the whole call and its phases:
+#   filter     time in data-layer helpers marked with @timed('filter')
+#   build      the rest of the callback function (figure/table construction)
+#   serialize  Dash's JSON encoding of the return value
+#Page callbacks additionally report the time of each node they rebuilt.
+#
+#Calls that raise count as errors, calls ending in PreventUpdate as prevented;
+#both are timed like the others.
+#
+#Every worker keeps its counters in memory and snapshots them to a JSON file
+#<pid>-<start>.json in GAPMINDER_METRICS_DIR (default <tmp>/gapminder-metrics)
+#at most once per second; /metrics sums the snapshots of all workers, so any
+#gunicorn worker can answer the scrape. The snapshot of a worker that exits is
+#removed (gunicorn's child_exit hook in gunicorn.conf.py calls
+#remove_process), and a scrape drops the snapshots of processes that are no
+#longer running, eg. after a crash or from an earlier run, so the sums and
+#gauges only cover the live workers.
+
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+PHASES = ['total', 'filter', 'build', 'serialize']
+FLUSH_SECONDS = 1.0
+
+_local = threading.local()
+
+
+def default_directory():
+    return os.environ.get('GAPMINDER_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'gapminder-metrics'))
+
+
+def snapshot_pid(path):
+    #pid of a snapshot file name, None for other files
+    try:
+        return int(os.path.basename(path).split('-', 1)[0])
+    except ValueError:
+        return None
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        #alive, owned by another user
+        return True
+    return True
+
+
+def remove_process(pid, directory = None):
+    #drop the snapshots of an exited process
+    for path in glob.glob(os.path.join(directory or default_directory(), '{}-*.json'.format(pid))):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _histogram():
+    return {'buckets': [0] * (len(BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+
+
+def _observe(hist, seconds):
+    i = 0
+    while i < len(BUCKETS) and seconds > BUCKETS[i]:
+        i += 1
+    hist['buckets'][i] += 1
+    hist['sum'] += seconds
+    hist['count'] += 1
+
+
+@contextmanager
+def phase(name):
+    #adds the block's time to a phase of the callback running on this thread
+    record = getattr(_local, 'record', None)
+    if record is None or name in record['open']:
+        yield
+        return
+    record['open'].add(name)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record['phases'][name] = record['phases'].get(name, 0.0) + time.perf_counter() - t0
+        record['open'].discard(name)
+
+
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def node(name):
+    record = getattr(_local, 'record', None)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if record is not None:
+            record['nodes'][name] = time.perf_counter() - t0
+
+
+class Metrics:
+    def __init__(self, directory = None):
+        self.directory = directory or default_directory()
+        os.makedirs(self.directory, exist_ok = True)
+        self.pid = None
+        self.callbacks = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+        self._flushed = 0.0
+
+    def _entry(self, name):
+        entry = self.callbacks.get(name)
+        if entry is None:
+            entry = self.callbacks[name] = {
+                'calls': 0,
+                'errors': 0,
+                'prevented': 0,
+                'response_bytes': 0,
+                'phases': {p: _histogram() for p in PHASES},
+                'nodes': {},
+            }
+        return entry
+
+    def record(self, name, total, func_time, phases, nodes, size, outcome = 'ok'):
+        filter_time = phases.get('filter', 0.0)
+        observed = {
+            'total': total,
+            'filter': filter_time,
+            'build': max(func_time - filter_time, 0.0),
+            'serialize': max(total - func_time, 0.0),
+        }
+        self._check_pid()
+        with self._lock:
+            entry = self._entry(name)
+            entry['calls'] += 1
+            if outcome != 'ok':
+                entry[outcome] += 1
+            entry['response_bytes'] += size
+            for p, seconds in observed.items():
+                _observe(entry['phases'][p], seconds)
+            for n, seconds in nodes.items():
+                _observe(entry['nodes'].setdefault(n, _histogram()), seconds)
+        self.flush()
+
+    def add_collector(self, prefix, func):
+        #func() -> {name: number}, exported as <prefix>_<name> summed over workers
+        self.collectors.append((prefix, func))
+
+    def snapshot(self):
+        with self._lock:
+            data = json.loads(json.dumps(self.callbacks))
+        extra = {}
+        for prefix, func in self.collectors:
+            for key, value in func().items():
+                extra['{}_{}'.format(prefix, key)] = value
+        return {'callbacks': data, 'extra': extra}
+
+    def _check_pid(self):
+        #first use in this process (eg. a worker forked from a preloaded master)
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            #snapshots of an earlier process with the same pid
+            remove_process(self.pid, self.directory)
+            self.path = os.path.join(self.directory, '{}-{}.json'.format(self.pid, int(time.time())))
+            with self._lock:
+                self.callbacks = {}
+
+    def flush(self, force = False):
+        self._check_pid()
+        now = time.time()
+        if not force and now - self._flushed < FLUSH_SECONDS:
+            return
+        self._flushed = now
+        fd, tmp = tempfile.mkstemp(dir = self.directory, suffix = '.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, self.path)
+
+    def collect(self):
+        #sum of the snapshots of every running worker
+        self.flush(force = True)
+        callbacks, extra = {}, {}
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            pid = snapshot_pid(path)
+            if pid is None:
+                continue
+            if pid != self.pid and not is_running(pid):
+                remove_process(pid, self.directory)
+                continue
+            try:
+                with open(path) as f:
+                    snap = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, entry in snap['callbacks'].items():
+                total = callbacks.setdefault(name, {'calls': 0, 'errors': 0, 'prevented': 0, 'response_bytes': 0,
+                                                    'phases': {}, 'nodes': {}})
+                for key in ('calls', 'errors', 'prevented'):
+                    total[key] += entry.get(key, 0)
+                total['response_bytes'] += entry['response_bytes']
+                for group in ('phases', 'nodes'):
+                    for key, hist in entry[group].items():
+                        merged = total[group].setdefault(key, _histogram())
+                        merged['buckets'] = [a + b for a, b in zip(merged['buckets'], hist['buckets'])]
+                        merged['sum'] += hist['sum']
+                        merged['count'] += hist['count']
+            for key, value in snap['extra'].items():
+                extra[key] = extra.get(key, 0) + value
+        return callbacks, extra
+
+    def exposition(self):
+        callbacks, extra = self.collect()
+        lines = [
+            '# HELP gapminder_callback_calls_total Server callback invocations.',
+            '# TYPE gapminder_callback_calls_total counter',
+        ]
+        for name, entry in sorted(callbacks.items()):
+            lines.append('gapminder_callback_calls_total{{callback="{}"}} {}'.format(name, entry['calls']))
+        lines += [
+            '# HELP gapminder_callback_errors_total Server callback invocations that raised.',
+            '# TYPE gapminder_callback_errors_total counter',
+        ]
+        for name, entry in sorted(callbacks.items()):
+            lines.append('gapminder_callback_errors_total{{callback="{}"}} {}'.format(name, entry['errors']))
+        lines += [
+            '# HELP gapminder_callback_prevented_total Server callback invocations ending in PreventUpdate.',
+            '# TYPE gapminder_callback_prevented_total counter',
+        ]
+        for name, entry in sorted(callbacks.items()):
+            lines.append('gapminder_callback_prevented_total{{callback="{}"}} {}'.format(name, entry['prevented']))
+        lines += [
+            '# HELP gapminder_callback_response_bytes_total Bytes of serialized callback responses.',
+            '# TYPE gapminder_callback_response_bytes_total counter',
+        ]
+        for name, entry in sorted(callbacks.items()):
+            lines.append('gapminder_callback_response_bytes_total{{callback="{}"}} {}'.format(name, entry['response_bytes']))
+
+        lines += [
+            '# HELP gapminder_callback_seconds Callback latency by phase (total, filter, build, serialize).',
+            '# TYPE gapminder_callback_seconds histogram',
+        ]
+        for name, entry in sorted(callbacks.items()):
+            for p, hist in sorted(entry['phases'].items()):
+                lines += _histogram_lines('gapminder_callback_seconds', 'callback="{}",phase="{}"'.format(name, p), hist)
+        lines += [
+            '# HELP gapminder_node_seconds Time of each output rebuilt by a page callback.',
+            '# TYPE gapminder_node_seconds histogram',
+        ]
+        for name, entry in sorted(callbacks.items()):
+            for n, hist in sorted(entry['nodes'].items()):
+                lines += _histogram_lines('gapminder_node_seconds', 'callback="{}",node="{}"'.format(name, n), hist)
+        for key, value in sorted(extra.items()):
+            lines.append('# TYPE gapminder_{} untyped'.format(key))
+            lines.append('gapminder_{} {}'.format(key, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(metric, labels, hist):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(BUCKETS + ['+Inf'], hist['buckets']):
+        cumulative += count
+        lines.append('{}_bucket{{{},le="{}"}} {}'.format(metric, labels, bound, cumulative))
+    lines.append('{}_sum{{{}}} {}'.format(metric, labels, hist['sum']))
+    lines.append('{}_count{{{}}} {}'.format(metric, labels, hist['count']))
+    return lines
+
+
+def instrument(app, metrics = None):
+    #wrap app.callback and add the /metrics route, call before registering callbacks
+    metrics = metrics or Metrics()
+    register = app.callback
+
+    def callback(output, inputs = [], state = []):
+        decorator = register(output, inputs, state)
+
+        def wrap(func):
+            name = func.__name__
+
+            @functools.wraps(func)
+            def timed_func(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    _local.record['func_time'] = time.perf_counter() - t0
+
+            dash_func = decorator(timed_func)
+
+            @functools.wraps(dash_func)
+            def measured(*args, **kwargs):
+                _local.record = {'phases': {}, 'nodes': {}, 'open': set(), 'func_time': 0.0}
+                t0 = time.perf_counter()
+                response, outcome = None, 'errors'
+                try:
+                    response = dash_func(*args, **kwargs)
+                    outcome = 'ok'
+                    return response
+                except PreventUpdate:
+                    outcome = 'prevented'
+                    raise
+                finally:
+                    record, _local.record = _local.record, None
+                    total = time.perf_counter() - t0
+                    metrics.record(name, total, record['func_time'], record['phases'], record['nodes'],
+                                    len(response) if isinstance(response, (str, bytes)) else 0, outcome)
+
+            for spec in app.callback_map.values():
+                if spec.get('callback') is dash_func:
+                    spec['callback'] = measured
+            return measured
+        return wrap
+
+    app.callback = callback
+
+    @app.server.route('/metrics')
+    def metrics_endpoint():
+        return flask.Response(metrics.exposition(), mimetype = 'text/plain; version=0.0.4')
+
+    return metrics
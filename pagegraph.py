@@ -0,0 +1,69 @@
+import inspect
+
+import dash
+
+import metrics
+
+#One multi-output callback per page.
+#
+#A page declares its inputs once under short names. Each output is produced by
+#a node function whose parameter names are the inputs it depends on, so every
+#control change is a single request: the callback rebuilds only the nodes that
+#read a changed input and returns no_update for the rest. Nodes of a page share
+#their filtered slices through small memoized helpers in index.py. A page with
+#a static export (export.py) serves the exported nodes from their files.
+
+
+class PageGraph:
+    def __init__(self, app, **inputs):
+        self.app = app
+        self.inputs = inputs
+        self.prop_names = {'{}.{}'.format(i.component_id, i.component_property): name
+                            for name, i in inputs.items()}
+        self.nodes = []
+        #lookup(node name, input values) -> exported value or None
+        self.exported = None
+
+    def output(self, *outputs):
+        def decorator(func):
+            params = list(inspect.signature(func).parameters)
+            unknown = [p for p in params if p not in self.inputs]
+            if unknown:
+                raise ValueError('{} reads unknown inputs {}'.format(func.__name__, unknown))
+            self.nodes.append((list(outputs), params, func))
+            return func
+        return decorator
+
+    def changed(self):
+        #names of the inputs that fired this request, None when everything must render
+        try:
+            triggered = dash.callback_context.triggered
+        except Exception:
+            return None
+        props = [t['prop_id'] for t in triggered or []]
+        if not props or '.' in props:
+            return None
+        return {self.prop_names[p] for p in props if p in self.prop_names}
+
+    def update(self, *args):
+        values = dict(zip(self.inputs, args))
+        changed = self.changed()
+        result = []
+        for outputs, params, func in self.nodes:
+            if changed is None or changed.intersection(params):
+                with metrics.node(func.__name__):
+                    value = self.exported(func.__name__, values) if self.exported else None
+                    if value is None:
+                        value = func(*[values[p] for p in params])
+                result.extend(value if len(outputs) > 1 else [value])
+            else:
+                result.extend([dash.no_update] * len(outputs))
+        return result
+
+    def register(self, name):
+        #`name` labels the page callback in the metrics
+        def update(*args):
+            return self.update(*args)
+        update.__name__ = name
+        outputs = [o for node in self.nodes for o in node[0]]
+        return self.app.callback(outputs, list(self.inputs.values()))(update)
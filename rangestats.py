@@ -0,0 +1,110 @@
+import numpy as np
+
+#Distribution summaries of one indicator per country over a year range.
+#
+#The violin graph used to ship every yearly value and let plotly.js compute
+#the statistics and the KDE in the browser. `RangeStats.summary` computes them
+#on the server for all selected countries at once: count/mean/std come from
+#prefix sums over the years (two lookups per country and range), quartiles,
+#Tukey fences and outliers from the range values, and the Gaussian KDE is
+#evaluated on a fixed grid of KDE_POINTS per country, with plotly's bandwidth
+#rule and 'soft' span, so the figure only carries the summaries.
+
+KDE_POINTS = 32
+#countries per KDE block, bounds the rows x grid x years temporary
+KDE_BLOCK = 32
+
+
+def row_min(values, keep):
+    #min of the kept values of every row, NaN for a row without any (np.nanmin would warn)
+    return np.where(keep.any(axis = 1), np.where(keep, values, np.inf).min(axis = 1), np.nan)
+
+
+def row_max(values, keep):
+    return np.where(keep.any(axis = 1), np.where(keep, values, -np.inf).max(axis = 1), np.nan)
+
+
+def quantiles(values, count, qs):
+    #linear-interpolated quantiles of every row at once (np.nanpercentile loops over rows)
+    ordered = np.sort(values, axis = 1)
+    out = []
+    for q in qs:
+        position = q * np.maximum(count - 1, 0)
+        lo = np.floor(position).astype(int)
+        hi = np.minimum(lo + 1, np.maximum(count - 1, 0))
+        a = np.take_along_axis(ordered, lo[:, None], axis = 1)[:, 0]
+        b = np.take_along_axis(ordered, hi[:, None], axis = 1)[:, 0]
+        out.append(np.where(count > 0, a + (b - a) * (position - lo), np.nan))
+    return out
+
+
+class RangeStats:
+    def __init__(self, cube):
+        self.cube = cube
+
+    def prefix(self, name):
+        #cumulative count, sum and sum of squares over the years: 3 x countries x (years + 1)
+        return self.cube.cache.fetch(('prefix', name), lambda: self.prefix_sums(name))
+
+    def prefix_sums(self, name):
+        values = self.cube.indicator(name)
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, 0.0)
+        out = np.zeros((3, values.shape[0], values.shape[1] + 1))
+        np.cumsum(valid, axis = 1, out = out[0, :, 1:])
+        np.cumsum(filled, axis = 1, out = out[1, :, 1:])
+        np.cumsum(filled ** 2, axis = 1, out = out[2, :, 1:])
+        return out
+
+    def moments(self, name, rows, y0, y1):
+        #count, mean and sample std of the year indexes [y0, y1) for every row
+        p = self.prefix(name)[:, rows]
+        count, total, squares = p[:, :, y1] - p[:, :, y0]
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            mean = np.where(count > 0, total / count, np.nan)
+            var = (squares - count * mean ** 2) / (count - 1)
+        std = np.where(count > 1, np.sqrt(np.maximum(var, 0.0)), 0.0)
+        return count.astype(int), mean, std
+
+    def summary(self, name, rows, year1, year2):
+        #dict of per-row arrays, `grid`/`density` are rows x KDE_POINTS
+        y0, y1 = self.cube.year_index(year1), self.cube.year_index(year2) + 1
+        rows = np.asarray(rows, dtype = int)
+        count, mean, std = self.moments(name, rows, y0, y1)
+        values = self.cube.indicator(name, rows[:, None], np.arange(y0, y1)[None, :])
+        valid = ~np.isnan(values)
+
+        #countries without data in the range stay NaN; errstate is per thread
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            q1, median, q3 = quantiles(values, count, [0.25, 0.5, 0.75])
+            low, high = row_min(values, valid), row_max(values, valid)
+            iqr = q3 - q1
+            lowerfence = row_min(values, valid & (values >= (q1 - 1.5 * iqr)[:, None]))
+            upperfence = row_max(values, valid & (values <= (q3 + 1.5 * iqr)[:, None]))
+
+            #Silverman's rule as in plotly.js, a tiny width for constant series
+            spread = np.minimum(std, iqr / 1.349)
+            spread = np.where(spread > 0, spread, std)
+            bandwidth = 1.059 * spread * np.maximum(count, 1) ** -0.2
+            bandwidth = np.where(bandwidth > 0, bandwidth, np.maximum(np.abs(median) * 1e-3, 1e-9))
+
+            steps = np.linspace(0.0, 1.0, KDE_POINTS)
+            start, stop = low - 2 * bandwidth, high + 2 * bandwidth
+            grid = start[:, None] + (stop - start)[:, None] * steps[None, :]
+            density = np.zeros_like(grid)
+            filled = np.where(valid, values, 0.0)
+            for i in range(0, len(rows), KDE_BLOCK):
+                block = slice(i, i + KDE_BLOCK)
+                z = (grid[block, :, None] - filled[block, None, :]) / bandwidth[block, None, None]
+                kernel = np.where(valid[block, None, :], np.exp(-0.5 * z ** 2), 0.0)
+                density[block] = kernel.sum(axis = 2)
+            density /= (np.maximum(count, 1) * bandwidth * np.sqrt(2 * np.pi))[:, None]
+
+        outliers = valid & ((values < lowerfence[:, None]) | (values > upperfence[:, None]))
+        return {
+            'count': count, 'mean': mean, 'std': std,
+            'min': low, 'q1': q1, 'median': median, 'q3': q3, 'max': high,
+            'lowerfence': lowerfence, 'upperfence': upperfence,
+            'outliers': [values[i][outliers[i]] for i in range(len(rows))],
+            'grid': grid, 'density': density,
+        }
@@ -0,0 +1,95 @@
+import argparse
+
+import numpy as np
+
+#Narrow storage types for the gapminder columns.
+#
+#Country and Continent are kept as int16 codes into their category lists and
+#Year as int16. Every indicator gets the smallest exact encoding that fits its
+#values: a decimal scale (1, 10, ... 10000) and an int16/int32 code, with the
+#type's minimum standing for a missing value, eg. life expectancy 28.2 is
+#stored as the int16 282. Decoding divides by the scale, which gives back the
+#very same float64 the csv parser produced, so the displayed numbers do not
+#change. Columns that no scale represents exactly (CO2) stay float64.
+#
+#Values are decoded to float64 (NaN for missing) only where they are computed
+#with or serialized; the source dtype is kept for display (Population is an
+#integer column).
+#
+#   python schema.py report     # per-column bytes before/after
+
+SCALES = [1, 10, 100, 1000, 10000]
+CODE_TYPES = [np.int16, np.int32]
+CATEGORY_TYPE = np.int16
+YEAR_TYPE = np.int16
+FLOAT = {'dtype': '<f8', 'scale': 1, 'missing': None}
+
+
+def infer(values):
+    #encoding of a numeric column: {'dtype', 'scale', 'missing'}
+    values = np.asarray(values, dtype = float)
+    finite = values[~np.isnan(values)]
+    for scale in SCALES:
+        scaled = np.round(finite * scale)
+        if not np.array_equal(scaled / scale, finite):
+            continue
+        for code_type in CODE_TYPES:
+            info = np.iinfo(code_type)
+            if len(scaled) == 0 or (scaled.min() > info.min and scaled.max() <= info.max):
+                return {'dtype': np.dtype(code_type).str, 'scale': scale, 'missing': int(info.min)}
+        break
+    return dict(FLOAT)
+
+
+def encode(values, encoding):
+    values = np.asarray(values, dtype = float)
+    if encoding['missing'] is None:
+        return values.astype(encoding['dtype'])
+    codes = np.round(np.where(np.isnan(values), 0, values) * encoding['scale'])
+    codes = codes.astype(encoding['dtype'])
+    codes[np.isnan(values)] = encoding['missing']
+    return codes
+
+
+def decode(codes, encoding):
+    #float64 values, NaN where missing
+    if encoding['missing'] is None:
+        return np.asarray(codes, dtype = float)
+    codes = np.asarray(codes)
+    return np.where(codes == encoding['missing'], np.nan, codes / encoding['scale'])
+
+
+def nbytes(df):
+    #deep per-column memory of a dataframe
+    return df.memory_usage(deep = True, index = False).to_dict()
+
+
+def report():
+    import datastore
+
+    before = nbytes(datastore.read_csv())
+    store = datastore.open_store()
+    if store is None:
+        datastore.build()
+        store = datastore.open_store()
+    after = {name: values.nbytes for name, values in store.columns.items()}
+    print('{:<36} {:>10} {:>12} {:>12} {:>7}'.format('column', 'stored as', 'before', 'after', 'ratio'))
+    for name in before:
+        print('{:<36} {:>10} {:>12,} {:>12,} {:>6.1f}x'.format(
+            name, store.columns[name].dtype.name, before[name], after[name], before[name] / after[name]))
+    total_before, total_after = sum(before.values()), sum(after.values())
+    print('{:<36} {:>10} {:>12,} {:>12,} {:>6.1f}x'.format(
+        'total', '', total_before, total_after, total_before / total_after))
+
+    cube = datastore.load_cube()
+    dense = cube.present.size * len(cube.indicators) * 8
+    compact = sum(cube.columns[name].nbytes for name in cube.indicators)
+    print('\ncube indicators: float64 {:,} bytes, encoded {:,} bytes ({:.1f}x)'.format(
+        dense, compact, dense / compact))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Memory report of the compact gapminder schema.')
+    parser.add_argument('command', choices = ['report'])
+    parser.parse_args()
+    report()
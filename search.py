@@ -0,0 +1,78 @@
+import bisect
+import unicodedata
+
+#Search-as-you-type over place names.
+#
+#`NameIndex.search(query)` returns the names to offer for the text typed in a
+#dropdown, best matches first:
+#   1. names starting with the query, alphabetically (bisect on the sorted names)
+#   2. names with a later word starting with it, eg. 'kingdom' -> 'United Kingdom'
+#      (bisect on the sorted word suffixes)
+#   3. names containing it anywhere, for queries of 2+ characters (the names of
+#      the shortest bigram/trigram posting list of the query, checked in order)
+#Matching ignores case and accents. Only the matches are sent to the browser,
+#whose own filter (substring, case-insensitive) keeps them all.
+
+LIMIT = 20
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', str(text))
+    return ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+
+
+def grams(key, n):
+    return {key[i:i + n] for i in range(len(key) - n + 1)}
+
+
+class NameIndex:
+    def __init__(self, names):
+        self.names = sorted(names, key = normalize)
+        self.keys = [normalize(name) for name in self.names]
+
+        #suffixes of the name starting at every later word
+        words = sorted((key[i:], idx) for idx, key in enumerate(self.keys)
+                        for i in range(1, len(key)) if not key[i - 1].isalnum() and key[i].isalnum())
+        self.word_keys = [w[0] for w in words]
+        self.word_ids = [w[1] for w in words]
+
+        #bigram and trigram -> ids of the names containing it, in name order
+        self.postings = {}
+        for idx, key in enumerate(self.keys):
+            for gram in grams(key, 2) | grams(key, 3):
+                self.postings.setdefault(gram, []).append(idx)
+
+    def search(self, query, limit = LIMIT):
+        q = normalize(query).strip()
+        if not q:
+            return self.names[:limit]
+        found = []
+        seen = set()
+
+        def add(idx):
+            if idx not in seen:
+                seen.add(idx)
+                found.append(idx)
+            return len(found) >= limit
+
+        i = bisect.bisect_left(self.keys, q)
+        while i < len(self.keys) and self.keys[i].startswith(q):
+            if add(i):
+                return [self.names[j] for j in found]
+            i += 1
+
+        i = bisect.bisect_left(self.word_keys, q)
+        while i < len(self.word_keys) and self.word_keys[i].startswith(q):
+            if add(self.word_ids[i]):
+                return [self.names[j] for j in found]
+            i += 1
+
+        if len(q) >= 2:
+            candidates = min((self.postings.get(gram, []) for gram in grams(q, min(len(q), 3))), key = len)
+            for idx in candidates:
+                if q in self.keys[idx] and add(idx):
+                    break
+        return [self.names[j] for j in found]
+
+    def __len__(self):
+        return len(self.names)
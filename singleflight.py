@@ -0,0 +1,95 @@
+import functools
+import hashlib
+import json
+import threading
+
+import dash
+
+#Coalescing of identical concurrent callback calls.
+#
+#Visitors opening the same page at the same moment send the same callback
+#requests (same inputs, same triggering props). `coalesce(app, flights)` wraps
+#app.callback so that, within a worker, the first of those requests computes
+#the result and the requests arriving while it runs wait for it and share it
+#instead of computing it again. Nothing is kept after the computation
+#finishes, repeated requests are left to the figure cache.
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, namespace = ''):
+        #a string, or a callable returning the namespace of the current request (eg. the data version)
+        self.namespace = namespace
+        self.computed = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def key(self, name, args, triggered):
+        namespace = self.namespace() if callable(self.namespace) else self.namespace
+        raw = json.dumps([namespace, name, args, triggered], sort_keys = True, default = str)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def do(self, key, func):
+        #func() once for all the concurrent calls with the same key
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.computed += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        return {'computed': self.computed, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
+
+
+def triggered():
+    try:
+        return [t['prop_id'] for t in dash.callback_context.triggered or []]
+    except Exception:
+        return None
+
+
+def coalesce(app, flights = None):
+    #wrap app.callback, call before registering callbacks
+    flights = flights or SingleFlight()
+    register = app.callback
+
+    def callback(output, inputs = [], state = []):
+        decorator = register(output, inputs, state)
+
+        def wrap(func):
+            name = func.__name__
+
+            @functools.wraps(func)
+            def shared(*args):
+                return flights.do(flights.key(name, args, triggered()), lambda: func(*args))
+
+            return decorator(shared)
+        return wrap
+
+    app.callback = callback
+    return flights
@@ -0,0 +1,146 @@
+import numpy as np
+
+#Server-side paging, sorting and filtering for the DataTables.
+#
+#The tables run with page_action/sort_action/filter_action = 'custom', so the
+#browser only receives the visible page. Sorted country orders are computed
+#for every year of an indicator in both directions the first time the
+#indicator is sorted on (and kept in the cube's cache); a request picks the order,
+#drops the countries outside the table, applies the filter mask and slices the
+#page, so the cost does not depend on sorting at request time.
+
+PAGE_SIZE = 20
+
+#dash-table filter operators, longest spellings first
+OPERATORS = [['ge ', '>='], ['le ', '<='], ['lt ', '<'], ['gt ', '>'], ['ne ', '!='], ['eq ', '='],
+            ['contains '], ['datestartswith ']]
+
+
+def argsort_nan_last(values, descending = False):
+    #stable sort, missing values at the end in both directions
+    return np.argsort(-values if descending else values, kind = 'stable')
+
+
+class TableIndex:
+    def __init__(self, cube):
+        self.cube = cube
+        n = len(cube.countries)
+        self.name_rank = np.empty(n, dtype = np.int32)
+        self.name_rank[np.argsort(np.asarray(cube.countries, dtype = object), kind = 'stable')] = np.arange(n)
+        cont_rank = np.argsort(np.argsort(np.asarray(cube.continents, dtype = object), kind = 'stable'))
+        self.continent_rank = cont_rank[cube.country_continent]
+
+        #file order is the unsorted order of every table
+        by_file = np.empty(n, dtype = np.int32)
+        by_file[cube.file_order] = np.arange(n)
+
+        dtype = self.dtype = np.int16 if n < 2 ** 15 else np.int32
+        self.orders = {}
+        for direction in (False, True):
+            self.orders[('Country', direction)] = argsort_nan_last(self.name_rank.astype(float), direction).astype(dtype)
+            key = self.continent_rank * n + by_file
+            self.orders[('Continent', direction)] = argsort_nan_last(key.astype(float), direction).astype(dtype)
+
+    def value_orders(self, name):
+        #direction x year x countries, countries pre-sorted in file order so ties keep it
+        base = self.cube.file_order
+        values = self.cube.indicator(name, base)
+        out = np.empty((2, values.shape[1], values.shape[0]), dtype = self.dtype)
+        for direction in (False, True):
+            order = np.argsort(-values if direction else values, axis = 0, kind = 'stable')
+            out[int(direction)] = base[order].T
+        return out
+
+    def order(self, year, sort_by):
+        #country codes sorted for the table's sort_by, file order by default
+        if not sort_by:
+            return self.cube.file_order
+        column = sort_by[0]['column_id']
+        descending = sort_by[0]['direction'] == 'desc'
+        if (column, descending) in self.orders:
+            return self.orders[(column, descending)]
+        if column in self.cube.indicator_code:
+            orders = self.cube.cache.fetch(('orders', column), lambda: self.value_orders(column))
+            return orders[int(descending), self.cube.year_index(year)]
+        return self.cube.file_order
+
+    def sort_pairs(self, rows, y, sort_by):
+        #order of (country, year) pairs for tables spanning several years
+        if not sort_by:
+            return np.arange(len(rows))
+        column = sort_by[0]['column_id']
+        descending = sort_by[0]['direction'] == 'desc'
+        if column == 'Country':
+            key = self.name_rank[rows]
+        elif column == 'Continent':
+            key = self.continent_rank[rows]
+        elif column == 'Year':
+            key = y
+        else:
+            key = self.cube.indicator(column, rows, y)
+        return argsort_nan_last(np.asarray(key, dtype = float), descending)
+
+
+def split_filter_part(filter_part):
+    for operator_type in OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+                value_part = value_part.strip()
+                v0 = value_part[:1]
+                if v0 and v0 == value_part[-1] and v0 in ("'", '"', '`'):
+                    value = value_part[1: -1].replace('\\' + v0, v0)
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+                return name, operator_type[0].strip(), value
+    return [None] * 3
+
+
+def filter_mask(cube, rows, y, filter_query):
+    #boolean mask over the (country, year) pairs for a dash-table filter_query
+    mask = np.ones(len(rows), dtype = bool)
+    if not filter_query:
+        return mask
+    for part in filter_query.split(' && '):
+        name, operator, value = split_filter_part(part)
+        if name is None:
+            continue
+        column = np.asarray(cube.column_values(name, rows, y))
+        if column.dtype == object and not isinstance(value, str):
+            value = str(value)
+        if operator == 'contains' or operator == 'datestartswith':
+            text = column.astype(str)
+            needle = str(value)
+            if operator == 'contains':
+                keep = np.char.find(np.char.lower(text), needle.lower()) >= 0
+            else:
+                keep = np.char.startswith(text, needle)
+        elif isinstance(value, str):
+            text = column.astype(str)
+            keep = {'eq': text == value, 'ne': text != value}.get(operator, np.zeros(len(rows), dtype = bool))
+        else:
+            with np.errstate(invalid = 'ignore'):
+                numbers = column.astype(float)
+                keep = {
+                    'eq': numbers == value, 'ne': numbers != value,
+                    'lt': numbers < value, 'le': numbers <= value,
+                    'gt': numbers > value, 'ge': numbers >= value,
+                }[operator]
+        mask &= keep
+    return mask
+
+
+def page(rows, page_current, page_size):
+    page_current = page_current or 0
+    page_size = page_size or PAGE_SIZE
+    return rows[page_current * page_size:(page_current + 1) * page_size]
+
+
+def columns(names):
+    #column definitions with numeric typing so dash-table emits numeric filters
+    return [{'id': c, 'name': c, 'type': 'text' if c in ('Country', 'Continent') else 'numeric'}
+            for c in dict.fromkeys(names)]
@@ -0,0 +1,38 @@
+import json
+import sys
+
+from plotly.utils import PlotlyJSONEncoder
+
+#Writes the golden figures of tests/test_figures.py with the go.* builders of
+#index.py from before figures.py (commit 51d73f5), run on the current data:
+#
+#   git worktree add /tmp/pre-lean 51d73f5
+#   cp Data/gapminder_dd.csv /tmp/pre-lean/Data/
+#   (cd /tmp/pre-lean && PYTHONPATH=. python $OLDPWD/tests/golden/make_figures.py $OLDPWD/tests/golden/figures.json)
+#
+#Arguments are those of the builders at that commit.
+
+CASES = {
+    'render_xaxis_graph': [('Life Expectancy', 'mean'), ('Population', 'weighted'), ('Number of HIV cases', 'count')],
+    'render_yaxis_graph': [('Income (per person)', 'median'), ('Human Development Index', 'max')],
+    'render_cont_graph': [('Life Expectancy', 'Income (per person)', 'Asia', 2005),
+                            ('Population', 'CO2 emission (tonnes per person)', 'Oceania', 1950)],
+    'render_cont_pie_xaxis': [('Life Expectancy', 'Europe', 2005), ('Population', 'Africa', 1990)],
+    'render_cont_pie_yaxis': [('Income (per person)', 'Africa', 2005), ('Child Mortality (per 1000 born)', 'North America', 1960)],
+    'render_country_compare_cat': [(['Vietnam', 'Gabon', 'Tuvalu', 'Slovenia', 'Jamaica', 'Chile'], 'Income (per person)'),
+                                    (['Chile'], 'Population')],
+}
+
+
+if __name__ == '__main__':
+    import index
+
+    out = {}
+    for name, cases in CASES.items():
+        func = getattr(index, name)
+        #the raw builder, not the figure cache
+        func = getattr(func, '__wrapped__', func)
+        out[name] = [{'args': list(args), 'figure': json.loads(json.dumps(func(*args), cls = PlotlyJSONEncoder))}
+                     for args in cases]
+    with open(sys.argv[1], 'w') as f:
+        json.dump(out, f, sort_keys = True)
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+#Callbacks with a cleared year dropdown: no rows and the empty-state figure, not a
+#TypeError that fails every output of the page callback.
+
+XAXIS, YAXIS = 'Life Expectancy', 'Income (per person)'
+
+
+@pytest.fixture(scope = 'module')
+def index():
+    os.environ.setdefault('GAPMINDER_CACHE_DISK_BYTES', '0')
+    os.environ.setdefault('GAPMINDER_RELOAD_SECONDS', '0')
+    import index
+    return index
+
+
+def test_overview_table_without_year(index):
+    assert index.render_data_overview_table(None, XAXIS, YAXIS, 0, 10, [], '', None) == []
+
+
+def test_continent_without_year(index):
+    assert index.render_cont_table_data(XAXIS, YAXIS, 'Asia', None, 0, 10, [], '') == []
+    figure = index.render_cont_graph(XAXIS, YAXIS, 'Asia', None)
+    assert figure['data'] == [] and figure['layout']['annotations']
+
+
+def test_page_callbacks_without_year(index):
+    #outside a request every node of the page renders
+    overview = dict(xaxis = XAXIS, yaxis = YAXIS, year = None, agg = 'mean', page_current = 0,
+                    page_size = 10, sort_by = [], filter_query = '', selection = None)
+    continent = dict(xaxis = XAXIS, yaxis = YAXIS, cont = 'Asia', year = None, page_current = 0,
+                     page_size = 10, sort_by = [], filter_query = '', selection = None)
+    for page, values in ((index.overview_page, overview), (index.continent_page, continent)):
+        outputs = page.update(*[values[name] for name in page.inputs])
+        assert len(outputs) == sum(len(node[0]) for node in page.nodes)
@@ -0,0 +1,19 @@
+import shutil
+
+import numpy as np
+
+import datastore
+from cube import DataCube
+
+
+def test_loaded_cube_survives_removal_of_its_directory(tmp_path):
+    #datastore.load_cube removes the directories of older versions while
+    #requests pinned to them may still read their indicators
+    cube = DataCube.from_frame(datastore.load_dataset())
+    directory = str(tmp_path / 'cube')
+    cube.save(directory)
+    loaded = DataCube.load(directory)
+    shutil.rmtree(directory)
+
+    for name in cube.indicators:
+        assert np.array_equal(loaded.indicator(name), cube.indicator(name), equal_nan = True), name
@@ -0,0 +1,26 @@
+import numpy as np
+
+import datastore
+import etl
+
+#The store must not depend on which path built it: the committed csv
+#(datastore.py build, the fallback of a csv hot-reload) and the raw Gapminder
+#files (etl.py, run by bin/post_compile).
+
+
+def encodings(store_dir):
+    return {c['name']: (c.get('encoding'), c['dtype'], c.get('display'))
+            for c in datastore.read_manifest(store_dir)['columns']}
+
+
+def test_csv_and_etl_build_the_same_store(tmp_path):
+    from_csv, from_etl = str(tmp_path / 'csv'), str(tmp_path / 'etl')
+    datastore.build(store_dir = from_csv)
+    etl.run(store_dir = from_etl, force = True)
+
+    assert encodings(from_csv) == encodings(from_etl)
+    csv_store, etl_store = datastore.open_store(from_csv), datastore.open_store(from_etl)
+    for name in datastore.COLUMNS:
+        a, b = csv_store.values(name), etl_store.values(name)
+        assert a.dtype == b.dtype, name
+        assert np.array_equal(a, b, equal_nan = a.dtype.kind == 'f'), name
@@ -0,0 +1,61 @@
+import json
+import threading
+
+import numpy as np
+
+import encoding
+from figcache import DiskLRU, FigureCache
+
+
+def test_raw_json_is_spliced_in_unparsed():
+    figure = {'data': [{'x': np.array([1.5, np.nan]), 'name': 'Asia'}], 'layout': {}}
+    value = {'response': {'graph': {'figure': encoding.RawJSON(encoding.dumps(figure))}, 'rows': [None, 'x']}}
+    expected = encoding.dumps({'response': {'graph': {'figure': figure}, 'rows': [None, 'x']}})
+    assert encoding.dumps(value) == expected
+    assert json.loads(json.dumps(value, cls = encoding.FastJSONEncoder)) == json.loads(expected)
+    assert json.loads(json.dumps(value, cls = encoding.FastJSONEncoder, indent = 1)) == json.loads(expected)
+
+
+def test_raw_json_without_orjson(monkeypatch):
+    monkeypatch.setattr(encoding, 'orjson', None)
+    value = {'figure': encoding.RawJSON(b'{"data":[{"y":[1,null]}]}'), 'x': [float('nan')]}
+    assert json.loads(encoding.dumps(value)) == {'figure': {'data': [{'y': [1, None]}]}, 'x': [None]}
+
+
+def test_hit_returns_the_stored_json():
+    cache = FigureCache()
+    calls = []
+
+    @cache.memoize('graph')
+    def render(year):
+        calls.append(year)
+        return {'data': [{'y': np.array([year, np.nan])}]}
+
+    rendered = render(2005)
+    cached = render(2005)
+    assert calls == [2005]
+    assert isinstance(cached, encoding.RawJSON)
+    assert cached.payload == encoding.dumps(rendered)
+
+
+def test_disk_overwrite_keeps_the_byte_count(tmp_path):
+    disk = DiskLRU(str(tmp_path), 1000)
+    for payload in (b'x' * 300, b'y' * 200, b'z' * 250):
+        disk.set('graph', payload)
+    assert disk._bytes == 250 == disk._scan()[1]
+    assert disk.evictions == 0
+
+
+def test_counters_under_concurrent_gets():
+    cache = FigureCache()
+    cache.set('hit', b'{}')
+    def get():
+        for _ in range(2000):
+            cache.get('hit')
+            cache.get('miss')
+    threads = [threading.Thread(target = get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (16000, 16000)
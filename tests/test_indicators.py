@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import datastore
+import indicators
+from cube import DataCube
+
+NAME = 'Sugar per person g per day'
+
+
+@pytest.fixture(scope = 'module')
+def frame():
+    return datastore.load_dataset()
+
+
+def write_added(path, cube, value):
+    years = [int(year) for year in cube.years]
+    with open(str(path), 'w') as f:
+        f.write(','.join(['country'] + [str(year) for year in years]) + '\n')
+        for country in cube.countries[:5]:
+            f.write(','.join([country] + [str(value)] * len(years)) + '\n')
+
+
+def test_versions_keep_their_added_files(tmp_path, frame):
+    #a version pinned by a request reads the added file it was loaded with,
+    #whatever a newer version wrote next to it
+    data_dir, store_dir = tmp_path / 'data', tmp_path / 'store'
+    data_dir.mkdir()
+    old = DataCube.from_frame(frame)
+    write_added(data_dir / 'sugar_per_person_g_per_day.csv', old, 1.5)
+    old_registry = indicators.Registry(old, str(data_dir), str(store_dir))
+    assert old_registry.info()[-1] == dict(name = NAME, unit = '', dtype = None,
+                                           source = 'sugar_per_person_g_per_day.csv', loaded = False)
+    assert np.nanmax(old.indicator(NAME)) == 1.5
+
+    new = DataCube.from_frame(frame)
+    write_added(data_dir / 'sugar_per_person_g_per_day.csv', new, 2.5)
+    indicators.Registry(new, str(data_dir), str(store_dir))
+    assert np.nanmax(new.indicator(NAME)) == 2.5
+    assert len(list(store_dir.iterdir())) == 2
+    #the budget of the old version dropped its tables meanwhile
+    old_registry.cache.clear()
+    assert np.nanmax(old.indicator(NAME)) == 1.5
+
+
+def test_changed_file_is_not_read_into_an_older_version(tmp_path, frame):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    cube = DataCube.from_frame(frame)
+    write_added(data_dir / 'sugar_per_person_g_per_day.csv', cube, 1.5)
+    indicators.Registry(cube, str(data_dir), str(tmp_path / 'store'))
+    write_added(data_dir / 'sugar_per_person_g_per_day.csv', cube, 2.5)
+    with pytest.raises(ValueError):
+        cube.indicator(NAME)
@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+
+import metrics
+
+
+def dead_pid():
+    #pid of a process that has exited
+    child = subprocess.Popen([sys.executable, '-c', 'pass'])
+    child.wait()
+    return child.pid
+
+
+def write_snapshot(directory, pid, calls, gauge):
+    snap = {'callbacks': {'page': {'calls': calls, 'response_bytes': 0, 'phases': {}, 'nodes': {}}},
+            'extra': {'figure_cache_bytes': gauge}}
+    with open(os.path.join(str(directory), '{}-1.json'.format(pid)), 'w') as f:
+        json.dump(snap, f)
+
+
+def test_collect_drops_exited_processes(tmp_path):
+    m = metrics.Metrics(str(tmp_path))
+    m.add_collector('figure_cache', lambda: {'bytes': 10})
+    pid = dead_pid()
+    write_snapshot(tmp_path, pid, 5, 1000)
+    #the parent runs, its snapshot counts
+    write_snapshot(tmp_path, os.getppid(), 2, 100)
+
+    callbacks, extra = m.collect()
+    assert callbacks['page']['calls'] == 2
+    assert extra['figure_cache_bytes'] == 110
+    assert not os.path.exists(os.path.join(str(tmp_path), '{}-1.json'.format(pid)))
+
+
+def test_remove_process(tmp_path):
+    write_snapshot(tmp_path, 12345, 1, 1)
+    metrics.remove_process(12345, str(tmp_path))
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_errors_and_prevented_are_counted(tmp_path):
+    m = metrics.Metrics(str(tmp_path))
+    for outcome in ('ok', 'errors', 'prevented', 'prevented'):
+        m.record('page', 0.01, 0.01, {}, {}, 0, outcome)
+    callbacks, _ = m.collect()
+    assert (callbacks['page']['calls'], callbacks['page']['errors'], callbacks['page']['prevented']) == (4, 1, 2)
+    assert 'gapminder_callback_prevented_total{callback="page"} 2' in m.exposition()